@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """Performs a forwards and reverse 1D Fourier transform on an image."""
 import argparse
+from collections import OrderedDict
 import cv2 as cv
 import numpy as np
 
@@ -15,59 +16,266 @@ def main():
     parser.add_argument(
         'out_image',
         metavar='out',
+        nargs='?',
+        default=None,
         help='where the reconstructed image will be saved')
+    parser.add_argument(
+        '--method',
+        dest='method',
+        choices=['naive', 'fft'],
+        default='fft',
+        help='how the transform is computed (default: %(default)s)')
+    parser.add_argument(
+        '--cache-stats',
+        action='store_true',
+        dest='cache_stats',
+        help='prints the hit and miss counts of the table cache')
+    parser.add_argument(
+        '-b', '--bins',
+        dest='bins',
+        type=parse_bins,
+        default=None,
+        help='only computes and prints these frequencies, given as a '
+            'comma separated list of values or start:stop[:step] ranges')
     args = parser.parse_args()
+    if args.out_image is None and args.bins is None:
+        parser.error('either out or --bins must be given')
     
     original = cv.imread(args.in_image, cv.IMREAD_GRAYSCALE)
-    fourier = DFT(original, True)
-    reconstructed = DFT(fourier, False).reshape(original.shape)
-    reconstructed = complex_to_grayscale(reconstructed)
-    cv.imwrite(args.out_image, reconstructed)
-
-
-def cos_sin_cache(M):
-    """Returns the appropriate cosine and sine for a value of mu using
-    a cache."""
-    cache = {}
-    mu = yield
-    while True:
-        k = mu % M
-        if k in cache:
-            mu = yield cache[k]
-        else:
-            a = 2 * np.pi * k / M
-            c = np.cos(a)
-            s = np.sin(a)
-            cache[k] = (c, s)
-            mu = yield c, s
+    if args.bins is not None:
+        G = DFT_bins(original, True, args.bins)
+        for m, value in zip(args.bins, G):
+            print(f"G({m}) = {value:.6g} (|G| = {abs(value):.6g})")
+    
+    if args.out_image is not None:
+        fourier = DFT(original, True, args.method)
+        reconstructed = DFT(fourier, False, args.method)
+        reconstructed = reconstructed.reshape(original.shape)
+        reconstructed = complex_to_grayscale(reconstructed)
+        cv.imwrite(args.out_image, reconstructed)
+    
+    if args.cache_stats:
+        print(f"Cache hits: {TABLE_CACHE.hits}")
+        print(f"Cache misses: {TABLE_CACHE.misses}")
+        print(f"Cache size: {TABLE_CACHE.nbytes} bytes")
+
+
+class TableCache:
+    """Least recently used store of precomputed transform tables, bounded
+    by the total memory used by the tables."""
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._tables = OrderedDict()
+        self.max_bytes = max_bytes
+
+    @property
+    def max_bytes(self) -> int:
+        """The memory cap, in bytes; lowering it evicts tables at once."""
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value: int) -> None:
+        self._max_bytes = value
+        self._evict()
+
+    def get(self, key, build) -> np.array:
+        """Returns the table stored under key, calling build() to create
+        it if it isn't cached."""
+        table = self._tables.get(key)
+        if table is not None:
+            self.hits += 1
+            self._tables.move_to_end(key)
+            return table
+        
+        self.misses += 1
+        table = build()
+        table.flags.writeable = False
+        if table.nbytes <= self.max_bytes:
+            self._tables[key] = table
+            self.nbytes += table.nbytes
+            self._evict()
+        return table
+
+    def clear(self) -> None:
+        """Removes every table and resets the counters."""
+        self._tables.clear()
+        self.nbytes = self.hits = self.misses = 0
+
+    def _evict(self) -> None:
+        """Removes least recently used tables until under the memory cap."""
+        while self.nbytes > self.max_bytes:
+            _, table = self._tables.popitem(last=False)
+            self.nbytes -= table.nbytes
+
 
+TABLE_CACHE = TableCache()
 
-def DFT(g: np.array, forward: bool) -> np.array:
+
+def twiddles(M: int) -> np.array:
+    """Returns exp(2 pi i k / M) for every k in range(M)."""
+    return TABLE_CACHE.get(
+        ('twiddles', M),
+        lambda: np.exp(2j * np.pi * np.arange(M) / M))
+
+
+def DFT(g: np.array, forward: bool, method: str = 'fft') -> np.array:
     """Performs a 1D Discrete Fourier Transform on a series of complex values.
     
     Based on program 18.1 from Digital Image Processing by Wilhelm Burger and
-    Mark J. Burge."""
+    Mark J. Burge. The naive method follows the book's O(M^2) loop, while
+    the fft method computes the same values in O(M log M)."""
+    g = g.ravel()
+    M = len(g)
+    s = 1 / np.sqrt(M)
+
+    if method == 'naive':
+        G = naive_dft(g, forward)
+    elif method == 'fft':
+        G = fft_1d(g, forward)
+    else:
+        raise ValueError(f"Invalid method: {method}")
+    
+    G *= s
+    return G
+
+
+def DFT_bins(g: np.array, forward: bool, bins) -> np.array:
+    """Performs a 1D Discrete Fourier Transform on a series of complex values,
+    computing only the frequencies in bins.
+    
+    Each frequency is the dot product of g with a row of the DFT basis
+    taken from the cached twiddle table, so K bins cost O(K M) and the
+    scaling matches DFT."""
     g = g.ravel()
     M = len(g)
-    G = np.empty_like(g, dtype=complex)
     s = 1 / np.sqrt(M)
+    w = twiddles(M)
+    u = np.arange(M)
+    bins = np.asarray(bins, dtype=np.intp).ravel()
+    G = np.empty(len(bins), dtype=complex)
+
+    for i, m in enumerate(bins):
+        row = w[m % M * u % M]
+        if forward:
+            G[i] = np.dot(row, g)
+        else:
+            G[i] = np.vdot(row, g)
+    
+    G *= s
+    return G
+
+
+def parse_bins(text: str) -> list:
+    """Parses a comma separated list of frequencies and start:stop[:step]
+    ranges into a list of frequencies."""
+    bins = []
+    try:
+        for item in text.split(','):
+            if ':' in item:
+                bins.extend(range(*(int(i) for i in item.split(':'))))
+            else:
+                bins.append(int(item))
+    except (TypeError, ValueError):
+        raise argparse.ArgumentTypeError(f"invalid bins: {text!r}")
+    return bins
+
+
+def naive_dft(g: np.array, forward: bool) -> np.array:
+    """Performs an unscaled 1D DFT by directly evaluating every sum."""
+    M = len(g)
+    G = np.empty_like(g, dtype=complex)
 
-    cs = cos_sin_cache(M)
-    next(cs)
+    w = twiddles(M)
+    if not forward:
+        w = w.conj()
     
     for m in range(M):
         total = complex(0, 0)
         for u, item in enumerate(g):
-            cosw, sinw = cs.send(m * u)
-            if not forward:
-                sinw = -sinw
-            transform = complex(cosw, sinw)
-            total += item * transform
-        G[m] = total * s
+            total += item * w[m * u % M]
+        G[m] = total
+    
+    return G
+
+
+def fft_1d(g: np.array, forward: bool) -> np.array:
+    """Performs an unscaled 1D DFT in O(M log M), using radix-2 for powers
+    of two and Bluestein's algorithm for any other length."""
+    M = len(g)
+    sign = 1 if forward else -1
+    if M & (M - 1) == 0:
+        return fft_radix2(g, sign)
+    return fft_bluestein(g, sign)
+
+
+def fft_radix2(g: np.array, sign: int) -> np.array:
+    """Iterative radix-2 FFT for power of two lengths. Sign is the sign
+    of the exponent of the transform kernel."""
+    M = len(g)
+    G = np.array(g, dtype=complex)[bit_reversal(M)]
+    table = twiddles(M)
+    
+    #Each pass joins pairs of transforms of half the size.
+    size = 2
+    while size <= M:
+        half = size // 2
+        w = table[:M // 2:M // size]
+        if sign < 0:
+            w = w.conj()
+        blocks = G.reshape(-1, size)
+        odd = blocks[:, half:] * w
+        blocks[:, half:] = blocks[:, :half] - odd
+        blocks[:, :half] += odd
+        size *= 2
     
     return G
 
 
+def bit_reversal(M: int) -> np.array:
+    """Returns the bit reversal permutation of range(M), M a power of two."""
+    def build():
+        idx = np.zeros(1, dtype=np.intp)
+        while len(idx) < M:
+            idx = np.concatenate((idx * 2, idx * 2 + 1))
+        return idx
+    return TABLE_CACHE.get(('bit_reversal', M), build)
+
+
+def fft_bluestein(g: np.array, sign: int) -> np.array:
+    """Bluestein (chirp-z) FFT for any length, expressed as a circular
+    convolution evaluated with radix-2 transforms."""
+    M = len(g)
+    chirp, kernel = bluestein_tables(M, sign)
+    L = len(kernel)
+    
+    a = np.zeros(L, dtype=complex)
+    a[:M] = g * chirp
+    conv = fft_radix2(fft_radix2(a, -1) * kernel, 1) / L
+    return conv[:M] * chirp
+
+
+def bluestein_tables(M: int, sign: int) -> (np.array, np.array):
+    """Returns the chirp of length M and the radix-2 spectrum of the
+    convolution kernel used by Bluestein's algorithm."""
+    def build_chirp():
+        #n^2 is reduced modulo 2M to keep the chirp's phase accurate.
+        n = np.arange(M)
+        return np.exp(sign * 1j * np.pi * (n * n % (2 * M)) / M)
+    
+    def build_kernel():
+        L = 1 << (2 * M - 2).bit_length()
+        b = np.zeros(L, dtype=complex)
+        b[:M] = chirp.conj()
+        b[L - M + 1:] = chirp[:0:-1].conj()
+        return fft_radix2(b, -1)
+    
+    chirp = TABLE_CACHE.get(('chirp', M, sign), build_chirp)
+    kernel = TABLE_CACHE.get(('bluestein', M, sign), build_kernel)
+    return chirp, kernel
+
+
 def complex_to_grayscale(g: np.array) -> np.array:
     """Turns an array of complex numbers into a grayscale image."""
     def ctgs(p):
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 """Performs a forwards and reverse 2D Fourier transform on an image."""
 import argparse
+import glob
+import os
+import tempfile
+import tracemalloc
+import warnings
 import cv2 as cv
 import numpy as np
+from scheduler import run_bands
 
 
 def main():
@@ -11,11 +17,12 @@ def main():
     parser.add_argument(
         'in_path',
         metavar='in',
-        help='the image to be processed')
+        help='the image to be processed; with --batch, a directory or a '
+            'glob pattern')
     parser.add_argument(
         'out_path',
         metavar='out',
-        help='where the transform will be saved')
+        help='where the transform will be saved; with --batch, a directory')
     parser.add_argument(
         '-s', '--square',
         action='store_true',
@@ -26,47 +33,307 @@ def main():
         action='store_true',
         dest='grayscale',
         help='read the image in grayscale mode')
+    parser.add_argument(
+        '--real',
+        action='store_true',
+        dest='real',
+        help='uses a real-input transform of the spatial axes that only '
+            'stores half of the spectrum')
     parser.add_argument(
         '-r',
         metavar='recon',
         dest='recon_path',
-        help='where the reconstructed image will be saved')
+        help='where the reconstructed image will be saved; with --batch, '
+            'a directory')
+    parser.add_argument(
+        '-b', '--batch',
+        action='store_true',
+        dest='batch',
+        help='transforms a stack of images with the same size at once')
+    parser.add_argument(
+        '--workers',
+        metavar='N',
+        dest='workers',
+        type=int,
+        default=1,
+        help='how many threads share the transform (default: %(default)s)')
+    parser.add_argument(
+        '--out-of-core',
+        action='store_true',
+        dest='out_of_core',
+        help='transforms an image stored as a .npy file without loading it '
+            'into memory, saving the spectrum (and reconstruction) as .npy')
+    parser.add_argument(
+        '--memory',
+        metavar='MB',
+        dest='memory',
+        type=int,
+        default=1024,
+        help='memory budget of --out-of-core, in megabytes '
+            '(default: %(default)s)')
+    parser.add_argument(
+        '--debug',
+        action='store_true',
+        dest='debug',
+        help='prints the peak memory used to visualize the transform')
 
     args = parser.parse_args()
     
+    if args.batch:
+        batch(args.in_path, args.out_path, args.recon_path, args.grayscale,
+            args.real, args.square, args.workers)
+        return
+    
+    if args.out_of_core:
+        memory = args.memory * 2**20
+        nd_dft_out_of_core(args.in_path, args.out_path, True, memory)
+        if args.recon_path is not None:
+            nd_dft_out_of_core(args.out_path, args.recon_path, False, memory)
+        return
+    
     if args.grayscale:
         original = cv.imread(args.in_path, cv.IMREAD_GRAYSCALE)
     else:
         original = cv.imread(args.in_path)
     
-    fourier = fft(original)
-    fourier_pt = fourier_prettify(fourier)
+    width = original.shape[1]
+    if args.real:
+        fourier = rfft(original)
+        fourier_pt = fourier_prettify(fourier, width, debug=args.debug)
+    else:
+        fourier = fft(original, args.workers)
+        fourier_pt = fourier_prettify(fourier, debug=args.debug)
     if args.square:
         fourier_pt = square(fourier_pt)
     cv.imwrite(args.out_path, fourier_pt)
     
     if args.recon_path is not None:
-        reconstructed = ifft(fourier)
+        if args.real:
+            reconstructed = irfft(fourier, width)
+        else:
+            reconstructed = ifft(fourier, args.workers)
         reconstructed_gs = complex_to_grayscale(reconstructed)
         cv.imwrite(args.recon_path, reconstructed_gs)
 
 
-def nd_dft(g: np.array, forward: bool) -> np.array:
-    """Computes the n-dimensional Discrete Fourier Transform of g."""
+def nd_dft(g: np.array, forward: bool, workers: int = 1) -> np.array:
+    """Computes the n-dimensional Discrete Fourier Transform of g.
+    
+    Each axis is transformed in bands of another axis, shared by workers
+    threads and written straight into the result."""
     f = np.fft.fft if forward else np.fft.ifft
+    if g.ndim == 1:
+        return f(g)
+    
     for i in range(g.ndim):
-       g = f(g, axis=i)
+        j = 1 if i == 0 else 0
+        out = np.empty(g.shape, dtype=complex)
+        
+        def band(start, stop):
+            idx = [slice(None)] * g.ndim
+            idx[j] = slice(start, stop)
+            idx = tuple(idx)
+            out[idx] = f(g[idx], axis=i)
+        
+        run_bands(band, g.shape[j], workers)
+        g = out
     return g
 
 
-def fft(g: np.array) -> np.array:
+def nd_dft_out_of_core(in_path: str, out_path: str, forward: bool,
+        memory: int = 2**30, tmp_dir: str = None) -> None:
+    """Computes the Discrete Fourier Transform of an image stored in a .npy
+    file, writing it to another .npy file, while keeping about memory bytes
+    of it in RAM.
+    
+    Blocks of rows are transformed along the rows (and channels) and written
+    transposed to a temporary file, whose rows are then transformed as
+    columns of the original image and transposed back into the output. The
+    result matches nd_dft."""
+    f = np.fft.fft if forward else np.fft.ifft
+    g = np.load(in_path, mmap_mode='r')
+    if g.ndim not in (2, 3):
+        raise ValueError("Invalid image")
+    
+    H, W = g.shape[:2]
+    channels = g.shape[2:]
+    pixel = 16 * int(np.prod(channels))
+    transposed_shape = (W, H) + channels
+    
+    out = np.lib.format.open_memmap(
+        out_path, mode='w+', dtype=np.complex128, shape=g.shape)
+    with tempfile.TemporaryFile(dir=tmp_dir) as tmp_file:
+        tmp = np.memmap(tmp_file, dtype=np.complex128, mode='w+',
+            shape=transposed_shape)
+        
+        #Rows and channels.
+        rows = max(1, memory // (3 * pixel * W))
+        for r0 in range(0, H, rows):
+            block = f(g[r0:r0 + rows], axis=1)
+            if channels:
+                block = f(block, axis=2)
+            transpose_tiles(block, tmp[:, r0:r0 + rows])
+        
+        #Columns.
+        cols = max(1, memory // (3 * pixel * H))
+        for c0 in range(0, W, cols):
+            block = f(tmp[c0:c0 + cols], axis=1)
+            transpose_tiles(block, out[:, c0:c0 + cols])
+        
+        out.flush()
+        del tmp, out
+
+
+def transpose_tiles(src: np.array, dst: np.array, tile: int = 256) -> None:
+    """Copies the transpose of the first two axes of src into dst, one square
+    tile at a time so that both arrays are accessed in short runs."""
+    rows, cols = src.shape[:2]
+    for r0 in range(0, rows, tile):
+        for c0 in range(0, cols, tile):
+            dst[c0:c0 + tile, r0:r0 + tile] = (
+                src[r0:r0 + tile, c0:c0 + tile].swapaxes(0, 1))
+
+
+def fft(g: np.array, workers: int = 1) -> np.array:
     """Computes the forward n-dimensional Discrete Fourier Transform of g."""
-    return nd_dft(g, True)
+    return nd_dft(g, True, workers)
 
 
-def ifft(g: np.array) -> np.array:
+def ifft(g: np.array, workers: int = 1) -> np.array:
     """Computes the inverse n-dimensional Discrete Fourier Transform of g."""
-    return nd_dft(g, False)
+    return nd_dft(g, False, workers)
+
+
+def rfft(g: np.array, shape: (int, int) = None) -> np.array:
+    """Computes the forward 2D Discrete Fourier Transform of the spatial axes
+    of a real image, keeping only the non-redundant half of the spectrum.
+    
+    The channel axis, if any, is left untransformed. If shape is given, the
+    image is zero padded to it first."""
+    return np.fft.rfft2(g, s=shape, axes=(0, 1))
+
+
+def irfft(g: np.array, width: int) -> np.array:
+    """Computes the inverse of rfft for an image with the given width."""
+    return np.fft.irfft2(g, s=(g.shape[0], width), axes=(0, 1))
+
+
+def fft_batch(images, real: bool = False, workers: int = 1) -> np.array:
+    """Computes the forward 2D Discrete Fourier Transform of the spatial axes
+    of a stack of images with the same size.
+    
+    images is either an N x H x W(x C) array or a list of H x W(x C) arrays.
+    If real is set, only the half-spectrum is kept, as in rfft. The stack is
+    transformed in one call per band of 16 frames, shared by workers
+    threads."""
+    stack = stack_images(images)
+    if real:
+        f = np.fft.rfft2
+        shape = stack.shape[:2] + (stack.shape[2] // 2 + 1,) + stack.shape[3:]
+    else:
+        f = np.fft.fft2
+        shape = stack.shape
+    
+    out = np.empty(shape, dtype=complex)
+    def band(start, stop):
+        out[start:stop] = f(stack[start:stop], axes=(1, 2))
+    run_bands(band, len(stack), workers, 16)
+    return out
+
+
+def ifft_batch(g: np.array, width: int = None, workers: int = 1) -> np.array:
+    """Computes the inverse of fft_batch. If width is given, g is taken to
+    be a stack of half-spectra of images with that width."""
+    if width is None:
+        out = np.empty(g.shape, dtype=complex)
+        def band(start, stop):
+            out[start:stop] = np.fft.ifft2(g[start:stop], axes=(1, 2))
+    else:
+        out = np.empty(g.shape[:2] + (width,) + g.shape[3:])
+        def band(start, stop):
+            out[start:stop] = np.fft.irfft2(
+                g[start:stop], s=(g.shape[1], width), axes=(1, 2))
+    run_bands(band, len(g), workers, 16)
+    return out
+
+
+def stack_images(images) -> np.array:
+    """Copies a list of images with the same size into one preallocated
+    array; arrays are returned unchanged."""
+    if isinstance(images, np.ndarray):
+        return images
+    
+    first = images[0]
+    stack = np.empty((len(images),) + first.shape, dtype=first.dtype)
+    for i, image in enumerate(images):
+        if image.shape != first.shape:
+            raise ValueError("All images must have the same size")
+        stack[i] = image
+    return stack
+
+
+def find_images(pattern: str) -> list:
+    """Returns the sorted paths of the files in a directory or matched by
+    a glob pattern that OpenCV can read. Other files are skipped with a
+    warning."""
+    if os.path.isdir(pattern):
+        paths = (os.path.join(pattern, name) for name in os.listdir(pattern))
+    else:
+        paths = glob.glob(pattern)
+    
+    images = []
+    for path in sorted(path for path in paths if os.path.isfile(path)):
+        if cv.haveImageReader(path):
+            images.append(path)
+        else:
+            warnings.warn(f"Skipping file that isn't an image: {path}")
+    return images
+
+
+def load_stack(paths: list, grayscale: bool = False) -> np.array:
+    """Reads images with the same size into one preallocated array."""
+    flags = cv.IMREAD_GRAYSCALE if grayscale else cv.IMREAD_COLOR
+    stack = None
+    for i, path in enumerate(paths):
+        image = cv.imread(path, flags)
+        if image is None:
+            raise ValueError(f"Could not read image: {path}")
+        if stack is None:
+            stack = np.empty((len(paths),) + image.shape, dtype=image.dtype)
+        elif image.shape != stack.shape[1:]:
+            raise ValueError(f"Image has a different size: {path}")
+        stack[i] = image
+    return stack
+
+
+def batch(in_pattern: str, out_dir: str, recon_dir: str = None,
+        grayscale: bool = False, real: bool = False,
+        square_output: bool = False, workers: int = 1) -> None:
+    """Transforms every image in a directory or glob pattern as one stack,
+    saving the transforms and reconstructions under their original names."""
+    paths = find_images(in_pattern)
+    if not paths:
+        raise ValueError(f"No images found: {in_pattern}")
+    
+    stack = load_stack(paths, grayscale)
+    width = stack.shape[2] if real else None
+    fourier = fft_batch(stack, real, workers)
+    
+    os.makedirs(out_dir, exist_ok=True)
+    buffer = np.empty(stack.shape[1:], dtype=np.float32)
+    for path, g in zip(paths, fourier):
+        fourier_pt = fourier_prettify(g, width, buffer)
+        if square_output:
+            fourier_pt = square(fourier_pt)
+        cv.imwrite(os.path.join(out_dir, os.path.basename(path)), fourier_pt)
+    
+    if recon_dir is not None:
+        os.makedirs(recon_dir, exist_ok=True)
+        reconstructed = ifft_batch(fourier, width, workers)
+        for path, g in zip(paths, reconstructed):
+            reconstructed_gs = complex_to_grayscale(g)
+            cv.imwrite(os.path.join(recon_dir, os.path.basename(path)),
+                reconstructed_gs)
 
 
 def complex_to_grayscale(g: np.array) -> np.array:
@@ -76,36 +343,76 @@ def complex_to_grayscale(g: np.array) -> np.array:
     return np.array(g_normal, dtype='uint8')
 
 
-def half(ary, axis=0):
-    """Splits an array in half in an axis."""
-    return np.array_split(ary, 2, axis=axis)
-
-
-def vhalf(ary):
-    """Splits an array in half vertically (axis 0.)"""
-    return half(ary, axis=0)
-
-
-def hhalf(ary):
-    """Splits an array in half horizontally (axis 1.)"""
-    return half(ary, axis=1)
+def centred_magnitude(g: np.array, width: int = None,
+        out: np.array = None) -> np.array:
+    """Writes the magnitude of a 2D DFT into a float32 array, with the
+    zero frequency moved to the centre of the image.
+    
+    If width is given, g is taken to be the half-spectrum returned by rfft
+    for an image of that width, and the missing columns are rebuilt from
+    the Hermitian symmetry |G(u, v)| = |G(-u, -v)|. Quadrants are copied
+    straight from g into out, so no temporary arrays are created."""
+    R = g.shape[0]
+    W = g.shape[1] if width is None else width
+    shape = (R, W) + g.shape[2:]
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    elif out.shape != shape or out.dtype != np.float32:
+        raise ValueError("Invalid output buffer")
+    
+    #Output row i comes from row (i - a) % R, output column j from
+    #column (j - b) % W.
+    a, b = R // 2, W // 2
+    top, bottom = slice(None, a), slice(a, None)
+    left, right = slice(None, b), slice(b, None)
+    if width is None:
+        copies = [
+            ((top, left), (slice(R - a, None), slice(W - b, None))),
+            ((top, right), (slice(R - a, None), slice(None, W - b))),
+            ((bottom, left), (slice(None, R - a), slice(W - b, None))),
+            ((bottom, right), (slice(None, R - a), slice(None, W - b)))]
+    else:
+        #Columns left of the centre mirror the stored ones, so they are
+        #read backwards from row (a - i) % R and column b - j.
+        copies = [
+            ((top, right), (slice(R - a, None), slice(None, W - b))),
+            ((bottom, right), (slice(None, R - a), slice(None, W - b))),
+            ((slice(None, a + 1), left), (slice(a, None, -1), slice(b, 0, -1))),
+            ((slice(a + 1, None), left), (slice(None, a, -1), slice(b, 0, -1)))]
+    
+    for dst, src in copies:
+        np.abs(g[src], out=out[dst])
+    return out
 
 
-def fourier_prettify(g: np.array) -> np.array:
-    """Modifies a 2D DCT so it can be better visualized as an image."""
-    #Turns the values from complex to reals
-    g = np.log(abs(g))
+def fourier_prettify(g: np.array, width: int = None, out: np.array = None,
+        debug: bool = False) -> np.array:
+    """Modifies a 2D DFT so it can be better visualized as an image.
+    
+    If width is given, g is taken to be the half-spectrum returned by rfft
+    for an image of that width. The log-magnitude is computed in place in
+    out, a float32 buffer that can be reused between calls. If debug is
+    set, prints the peak memory allocated while running."""
+    if debug:
+        tracemalloc.start()
+        try:
+            g = fourier_prettify(g, width, out)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        print(f"Peak temporary memory: {peak} bytes")
+        return g
     
-    #Reorganizes the quadrants of the image
-    w, e = hhalf(g)
-    quads = vhalf(w) + vhalf(e)
-    w = np.vstack((quads[3], quads[2]))
-    e = np.vstack((quads[1], quads[0]))
-    g = np.hstack((w, e))
+    #Centres the spectrum and takes its logarithm, leaving log(0) as 0.
+    out = centred_magnitude(g, width, out)
+    np.log(out, out=out, where=out > 0)
     
-    #Normalizes the image  and turns it to grayscale
-    g = complex_to_grayscale(g)
-    g = cv.cvtColor(g, cv.COLOR_BGR2GRAY)
+    #Normalizes the image and turns it to grayscale
+    np.abs(out, out=out)
+    out *= 255 / out.max()
+    g = out.astype(np.uint8)
+    if g.ndim == 3:
+        g = cv.cvtColor(g, cv.COLOR_BGR2GRAY)
 
     return g
 
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Filters an image in the frequency domain with a low-pass, high-pass or
+notch filter."""
+import argparse
+import hashlib
+from collections import OrderedDict
+import cv2 as cv
+import e19_1 as fourier
+import numpy as np
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__)
+    parser.add_argument(
+        'filter',
+        metavar='filter',
+        choices=['lowpass', 'highpass', 'notch'],
+        help='which filter will be applied (%(choices)s)')
+    parser.add_argument(
+        'in_path',
+        metavar='in',
+        help='the image to be processed')
+    parser.add_argument(
+        'out_path',
+        metavar='out',
+        help='where the filtered image will be saved')
+    parser.add_argument(
+        '--sigma',
+        dest='sigma',
+        type=float,
+        default=2.0,
+        help='standard deviation of the Gaussian kernel, in pixels '
+            '(default: %(default)s)')
+    parser.add_argument(
+        '--notch',
+        dest='notch',
+        metavar=('U', 'V'),
+        nargs=2,
+        type=float,
+        default=[0.25, 0.0],
+        help='horizontal and vertical frequency removed by the notch filter, '
+            'in cycles per pixel (default: %(default)s)')
+    parser.add_argument(
+        '-g', '--grayscale',
+        action='store_true',
+        dest='grayscale',
+        help='read the image in grayscale mode')
+    parser.add_argument(
+        '-t', '--tile',
+        dest='tile',
+        type=int,
+        default=None,
+        help='filters the image in tiles of this size with overlap-add')
+
+    args = parser.parse_args()
+    
+    if args.grayscale:
+        original = cv.imread(args.in_path, cv.IMREAD_GRAYSCALE)
+    else:
+        original = cv.imread(args.in_path)
+    
+    if args.filter == 'lowpass':
+        kernel = lowpass_kernel(args.sigma)
+    elif args.filter == 'highpass':
+        kernel = highpass_kernel(args.sigma)
+    else:
+        kernel = notch_kernel(args.sigma, *args.notch)
+    
+    filtered = convolve(original, kernel, args.tile)
+    if args.filter == 'highpass':
+        #Centres the result, which has both signs, at mid gray.
+        filtered += 128
+    filtered = np.clip(np.rint(filtered), 0, 255).astype(np.uint8)
+    cv.imwrite(args.out_path, filtered)
+
+
+class SpectrumCache:
+    """Least recently used store of kernel spectra, keyed by the kernel's
+    contents and the padded shape it was transformed to."""
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._spectra = OrderedDict()
+
+    def get(self, kernel: np.array, shape: (int, int)) -> np.array:
+        """Returns the half-spectrum of kernel zero padded to shape."""
+        digest = hashlib.blake2b(np.ascontiguousarray(kernel)).digest()
+        key = (digest, kernel.shape, kernel.dtype.str, tuple(shape))
+        spectrum = self._spectra.get(key)
+        if spectrum is not None:
+            self.hits += 1
+            self._spectra.move_to_end(key)
+            return spectrum
+        
+        self.misses += 1
+        spectrum = fourier.rfft(kernel, shape)
+        spectrum.flags.writeable = False
+        self._spectra[key] = spectrum
+        while len(self._spectra) > self.max_entries:
+            self._spectra.popitem(last=False)
+        return spectrum
+
+    def clear(self) -> None:
+        """Removes every spectrum and resets the counters."""
+        self._spectra.clear()
+        self.hits = self.misses = 0
+
+
+SPECTRUM_CACHE = SpectrumCache()
+
+
+def next_fast_len(n: int) -> int:
+    """Returns the smallest integer not less than n whose only prime
+    factors are 2, 3 and 5, which the FFT handles quickly."""
+    best = 1 << max(n - 1, 0).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            #Smallest power of two that brings p35 to at least n.
+            p = p35
+            while p < n:
+                p *= 2
+            best = min(best, p)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def convolve(image: np.array, kernel: np.array, tile: int = None) -> np.array:
+    """Returns the convolution of an image with a 2D kernel, with the same
+    size as the image and zeros beyond its borders.
+    
+    Colour channels are filtered independently. If tile is given, the image
+    is processed in tiles of that size with overlap-add, so the transforms
+    never hold more than one padded tile."""
+    if image.ndim not in (2, 3):
+        raise ValueError("Invalid image")
+    if tile is not None:
+        return convolve_tiled(image, kernel, tile)
+    
+    H, W = image.shape[:2]
+    kh, kw = kernel.shape
+    shape = (next_fast_len(H + kh - 1), next_fast_len(W + kw - 1))
+    full = filter_block(image, kernel, shape)
+    
+    top, left = (kh - 1) // 2, (kw - 1) // 2
+    return full[top:top + H, left:left + W]
+
+
+def convolve_tiled(image: np.array, kernel: np.array, tile: int) -> np.array:
+    """Overlap-add version of convolve, transforming one tile at a time."""
+    H, W = image.shape[:2]
+    kh, kw = kernel.shape
+    shape = (next_fast_len(tile + kh - 1), next_fast_len(tile + kw - 1))
+    
+    out = np.zeros((H + kh - 1, W + kw - 1) + image.shape[2:])
+    for r0 in range(0, H, tile):
+        for c0 in range(0, W, tile):
+            block = image[r0:r0 + tile, c0:c0 + tile]
+            bh, bw = block.shape[:2]
+            full = filter_block(block, kernel, shape)
+            out[r0:r0 + bh + kh - 1, c0:c0 + bw + kw - 1] += (
+                full[:bh + kh - 1, :bw + kw - 1])
+    
+    top, left = (kh - 1) // 2, (kw - 1) // 2
+    return out[top:top + H, left:left + W]
+
+
+def filter_block(g: np.array, kernel: np.array, shape: (int, int)) -> np.array:
+    """Returns the circular convolution of g and kernel, both zero padded to
+    shape, using the cached spectrum of the kernel."""
+    spectrum = SPECTRUM_CACHE.get(kernel, shape)
+    if g.ndim == 3:
+        spectrum = spectrum[..., np.newaxis]
+    G = fourier.rfft(g, shape)
+    G *= spectrum
+    return fourier.irfft(G, shape[1])
+
+
+def gaussian_kernel(sigma: float) -> np.array:
+    """Returns a normalized 2D Gaussian kernel spanning 3 sigma each way."""
+    r = int(np.ceil(3 * sigma))
+    x = np.arange(-r, r + 1)
+    g = np.exp(-x ** 2 / (2 * sigma ** 2))
+    kernel = np.outer(g, g)
+    return kernel / kernel.sum()
+
+
+def lowpass_kernel(sigma: float) -> np.array:
+    """Returns a Gaussian low-pass kernel."""
+    return gaussian_kernel(sigma)
+
+
+def highpass_kernel(sigma: float) -> np.array:
+    """Returns the kernel that removes what the low-pass kernel keeps."""
+    kernel = -gaussian_kernel(sigma)
+    r = kernel.shape[0] // 2
+    kernel[r, r] += 1
+    return kernel
+
+
+def notch_kernel(sigma: float, u: float, v: float) -> np.array:
+    """Returns a kernel that removes the frequencies (u, v) and (-u, -v),
+    in cycles per pixel, with a Gaussian notch of the same width as the
+    low-pass filter with this sigma."""
+    kernel = gaussian_kernel(sigma)
+    r = kernel.shape[0] // 2
+    y, x = np.mgrid[-r:r + 1, -r:r + 1]
+    kernel *= -2 * np.cos(2 * np.pi * (u * x + v * y))
+    kernel[r, r] += 1
+    return kernel
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Compresses an image into quantized 8 x 8 block DCT coefficients, in the
+style of baseline JPEG, or decompresses it back."""
+import argparse
+import struct
+import zlib
+import cv2 as cv
+import e20_4 as transform
+import numpy as np
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__)
+    parser.add_argument(
+        'operation',
+        metavar='operation',
+        choices=['encode', 'decode'],
+        help='whether an image is encoded or a coefficient file is decoded '
+            '(%(choices)s)')
+    parser.add_argument(
+        'in_path',
+        metavar='in',
+        help='the image or coefficient file to be processed')
+    parser.add_argument(
+        'out_path',
+        metavar='out',
+        help='where the coefficient file or image will be saved')
+    parser.add_argument(
+        '-q', '--quality',
+        dest='quality',
+        type=int,
+        default=75,
+        help='the quality of the encoding, from 1 to 100 '
+            '(default: %(default)s)')
+    parser.add_argument(
+        '-g', '--grayscale',
+        action='store_true',
+        dest='grayscale',
+        help='read the image in grayscale mode')
+
+    args = parser.parse_args()
+    
+    if args.operation == 'encode':
+        if args.grayscale:
+            image = cv.imread(args.in_path, cv.IMREAD_GRAYSCALE)
+        else:
+            image = cv.imread(args.in_path)
+        with open(args.out_path, 'wb') as f:
+            f.write(encode(image, args.quality))
+    else:
+        with open(args.in_path, 'rb') as f:
+            image = decode(f.read())
+        cv.imwrite(args.out_path, image)
+
+
+#File layout: header, then a zlib stream with the number of coefficients
+#kept by each block (uint8) followed by all kept coefficients (int16).
+MAGIC = b'DCT8'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBII')
+
+#Quantization tables from Annex K of the JPEG standard.
+LUMINANCE_TABLE = np.array([
+    [16, 11, 10, 16, 24, 40, 51, 61],
+    [12, 12, 14, 19, 26, 58, 60, 55],
+    [14, 13, 16, 24, 40, 57, 69, 56],
+    [14, 17, 22, 29, 51, 87, 80, 62],
+    [18, 22, 37, 56, 68, 109, 103, 77],
+    [24, 35, 55, 64, 81, 104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99]])
+
+CHROMINANCE_TABLE = np.array([
+    [17, 18, 24, 47, 99, 99, 99, 99],
+    [18, 21, 26, 66, 99, 99, 99, 99],
+    [24, 26, 56, 99, 99, 99, 99, 99],
+    [47, 66, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99],
+    [99, 99, 99, 99, 99, 99, 99, 99]])
+
+
+def zigzag_order(M: int = 8) -> np.array:
+    """Returns the flat indices of an M x M block in zig-zag order."""
+    i, j = np.indices((M, M)).reshape(2, -1)
+    s = i + j
+    return np.lexsort((np.where(s % 2, i, -i), s))
+
+
+ZIGZAG = zigzag_order()
+
+
+def quantization_tables(quality: int, channels: int) -> np.array:
+    """Returns a channels x 8 x 8 stack of quantization tables scaled for a
+    quality from 1 to 100, following the IJG convention."""
+    if not 1 <= quality <= 100:
+        raise ValueError("Quality must be between 1 and 100")
+    scale = 5000 // quality if quality < 50 else 200 - 2 * quality
+    
+    tables = [LUMINANCE_TABLE] + [CHROMINANCE_TABLE] * (channels - 1)
+    tables = (np.array(tables) * scale + 50) // 100
+    return np.clip(tables, 1, 255)
+
+
+def to_blocks(G: np.array) -> np.array:
+    """Rearranges an H x W x C array into (H/8 * W/8) x C x 8 x 8 blocks."""
+    H, W, C = G.shape
+    G = G.reshape(H // 8, 8, W // 8, 8, C)
+    return G.transpose(0, 2, 4, 1, 3).reshape(-1, C, 8, 8)
+
+
+def from_blocks(blocks: np.array, H: int, W: int) -> np.array:
+    """Undoes to_blocks for an H x W image."""
+    C = blocks.shape[1]
+    G = blocks.reshape(H // 8, W // 8, C, 8, 8)
+    return G.transpose(0, 3, 1, 4, 2).reshape(H, W, C)
+
+
+def encode(image: np.array, quality: int = 75) -> bytes:
+    """Returns an 8-bit grayscale or BGR image encoded as quantized block
+    DCT coefficients."""
+    height, width = image.shape[:2]
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    if channels == 3:
+        image = cv.cvtColor(image, cv.COLOR_BGR2YCrCb)
+    elif channels != 1:
+        raise ValueError("Invalid image")
+    
+    #Level shift, transform and quantization.
+    g = image.reshape(height, width, channels) - 128.0
+    G = transform.fdct(g, 8)
+    blocks = to_blocks(G) / quantization_tables(quality, channels)
+    zz = np.rint(blocks).astype(np.int16).reshape(-1, 64)[:, ZIGZAG]
+    
+    #Only keeps coefficients up to the last nonzero one of each block.
+    nonzero = zz != 0
+    counts = 64 - np.argmax(nonzero[:, ::-1], axis=1)
+    counts[~nonzero.any(axis=1)] = 0
+    kept = zz[np.arange(64) < counts[:, np.newaxis]]
+    
+    header = HEADER.pack(MAGIC, VERSION, quality, channels, height, width)
+    payload = counts.astype(np.uint8).tobytes() + kept.astype('<i2').tobytes()
+    return header + zlib.compress(payload)
+
+
+def decode(data: bytes) -> np.array:
+    """Returns the 8-bit image encoded in data by encode."""
+    magic, version, quality, channels, height, width = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Invalid coefficient file")
+    payload = zlib.decompress(data[HEADER.size:])
+    
+    H = -(-height // 8) * 8
+    W = -(-width // 8) * 8
+    n = H * W * channels // 64
+    counts = np.frombuffer(payload, dtype=np.uint8, count=n)
+    kept = np.frombuffer(payload, dtype='<i2', offset=n)
+    
+    zz = np.zeros((n, 64), dtype=np.int16)
+    zz[np.arange(64) < counts[:, np.newaxis]] = kept
+    blocks = np.empty_like(zz)
+    blocks[:, ZIGZAG] = zz
+    blocks = blocks.reshape(-1, channels, 8, 8) * quantization_tables(
+        quality, channels)
+    
+    g = transform.idct(from_blocks(blocks, H, W), 8) + 128
+    image = np.clip(np.rint(g[:height, :width]), 0, 255).astype(np.uint8)
+    if channels == 3:
+        return cv.cvtColor(image, cv.COLOR_YCrCb2BGR)
+    return image[..., 0]
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 """Performs a forwards and reverse 2D DCT on an image."""
 import argparse
+from functools import lru_cache
 import cv2 as cv
+import fixed_dct
 import numpy as np
+from scheduler import run_bands
 
 
 def main():
@@ -38,15 +41,48 @@ def main():
         type=int,
         default=0,
         help='the size of the transformation matrix')
+    parser.add_argument(
+        '--method',
+        dest='method',
+        choices=['naive', 'matrix', 'fft'],
+        default='matrix',
+        help='how the full image transform is computed when no matrix size '
+            'is given (default: %(default)s)')
+    parser.add_argument(
+        '--pad',
+        dest='pad_mode',
+        choices=['edge', 'reflect', 'symmetric', 'constant', 'wrap', 'crop'],
+        default='edge',
+        help='how images are extended to a whole number of blocks, or crop '
+            'to drop the leftover pixels (default: %(default)s)')
+    parser.add_argument(
+        '--workers',
+        metavar='N',
+        dest='workers',
+        type=int,
+        default=1,
+        help='how many threads share the transform (default: %(default)s)')
+    parser.add_argument(
+        '--precision',
+        dest='precision',
+        choices=['float', 'int'],
+        default='float',
+        help='the arithmetic of the block transform; int uses fixed-point '
+            '8 x 8 kernels with int16 results and requires -m 8 '
+            '(default: %(default)s)')
 
     args = parser.parse_args()
+    if args.precision == 'int' and args.matrix_size != 8:
+        parser.error("--precision int requires -m 8")
     
     if args.grayscale:
         original = cv.imread(args.in_path, cv.IMREAD_GRAYSCALE)
     else:
         original = cv.imread(args.in_path)
     
-    transf_org = fdct(original, args.matrix_size)
+    pad_mode = None if args.pad_mode == 'crop' else args.pad_mode
+    transf_org = fdct(original, args.matrix_size, args.method, pad_mode,
+        args.workers, args.precision)
     
     transf = prettify(transf_org.copy())
     if args.square:
@@ -54,7 +90,9 @@ def main():
     cv.imwrite(args.out_path, transf)
     
     if args.recon_path is not None:
-        reconstructed = idct(transf_org, args.matrix_size)
+        reconstructed = idct(transf_org, args.matrix_size, args.method,
+            pad_mode, args.workers, args.precision)
+        reconstructed = reconstructed[:original.shape[0], :original.shape[1]]
         cv.imwrite(args.recon_path, reconstructed)
 
 
@@ -121,11 +159,41 @@ def idct_1d(G: np.array) -> np.array:
     return g
 
 
-def dct(g: np.array, forward: bool) -> np.array:
-    """Performs a forward or inverse DTC on an image."""
+def dct(g: np.array, forward: bool, method: str = 'matrix',
+        workers: int = 1) -> np.array:
+    """Performs a forward or inverse DTC on an image.
+    
+    The matrix method transforms each axis with a single matrix product
+    against its cached transform matrix, carrying colour channels along in
+    the same products. The fft method computes the same values in
+    O(M log M) per row, and the naive method evaluates every sum. The
+    matrix and fft methods split each axis into bands shared by workers
+    threads."""
+    if g.ndim not in (2, 3):
+        raise ValueError("Invalid image")
+    
+    if method == 'naive':
+        return naive_dct(g, forward)
+    elif method == 'fft':
+        return fft_dct(g, forward, workers)
+    elif method != 'matrix':
+        raise ValueError(f"Invalid method: {method}")
+    
+    A = cached_transform_matrix(g.shape[0])
+    B = cached_transform_matrix(g.shape[1])
+    if not forward:
+        A = A.transpose()
+        B = B.transpose()
+    
+    return separable_matmul(A, g, B, workers)
+
+
+def naive_dct(g: np.array, forward: bool) -> np.array:
+    """Performs a forward or inverse DTC on an image with dct_1d or
+    idct_1d."""
     if g.ndim == 3:
         channels = g.transpose(2, 0, 1)
-        channels_dct = np.array([dct(c, forward) for c in channels])
+        channels_dct = np.array([naive_dct(c, forward) for c in channels])
         return channels_dct.transpose(1, 2, 0)
     elif g.ndim != 2:
         raise ValueError("Invalid image")
@@ -140,56 +208,231 @@ def dct(g: np.array, forward: bool) -> np.array:
     return g
 
 
-def crop_matmul(A: np.array, B: np.array) -> np.array:
-    """Performs ABAt', where B' is a chunk of B the same size as A,
-    and At is the transpose of A."""
+def fft_dct(g: np.array, forward: bool, workers: int = 1) -> np.array:
+    """Performs a forward or inverse DTC on an image through FFTs, one axis
+    at a time, each split into bands of the other axis."""
+    f = fft_dct_axis if forward else fft_idct_axis
+    
+    t = np.empty(g.shape)
+    def columns(start, stop):
+        t[:, start:stop] = f(g[:, start:stop], 0)
+    run_bands(columns, g.shape[1], workers)
+    
+    G = np.empty(g.shape)
+    def rows(start, stop):
+        G[start:stop] = f(t[start:stop], 1)
+    run_bands(rows, g.shape[0], workers)
+    
+    return G
+
+
+def fft_dct_axis(g: np.array, axis: int) -> np.array:
+    """Performs a 1D forward DCT along an axis of g.
+    
+    Uses Makhoul's algorithm: the even samples followed by the odd samples
+    in reverse order are transformed with an M point FFT, and each
+    frequency is rotated by a quarter sample and scaled."""
+    g = np.moveaxis(np.asarray(g, dtype=np.float64), axis, -1)
+    scale, phase = dct_fft_weights(g.shape[-1])
+    
+    v = np.concatenate((g[..., ::2], g[..., 1::2][..., ::-1]), axis=-1)
+    V = np.fft.fft(v, axis=-1)
+    V *= phase
+    G = V.real * scale
+    
+    return np.moveaxis(G, -1, axis)
+
+
+def fft_idct_axis(G: np.array, axis: int) -> np.array:
+    """Performs a 1D inverse DCT along an axis of G, undoing each step of
+    fft_dct_axis."""
+    G = np.moveaxis(np.asarray(G, dtype=np.float64), axis, -1)
+    M = G.shape[-1]
+    scale, phase = dct_fft_weights(M)
+    
+    #Rebuilds the FFT of the reordered samples from its real part, using
+    #Im(V(m) phase(m)) = -Re(V(M - m) phase(M - m)).
+    Z = G / scale
+    Z_rev = np.zeros_like(Z)
+    Z_rev[..., 1:] = Z[..., :0:-1]
+    V = Z - 1j * Z_rev
+    V *= phase.conj()
+    v = np.fft.ifft(V, axis=-1).real
+    
+    g = np.empty_like(v)
+    h = (M + 1) // 2
+    g[..., ::2] = v[..., :h]
+    g[..., 1::2] = v[..., h:][..., ::-1]
+    
+    return np.moveaxis(g, -1, axis)
+
+
+@lru_cache(maxsize=8)
+def dct_fft_weights(M: int) -> (np.array, np.array):
+    """Returns the scale factors and quarter sample rotations that turn an
+    M point FFT of reordered samples into an orthonormal DCT."""
+    m = np.arange(M)
+    scale = np.full(M, np.sqrt(2 / M))
+    scale[0] /= np.sqrt(2)
+    phase = np.exp(-1j * np.pi * m / (2 * M))
+    scale.flags.writeable = False
+    phase.flags.writeable = False
+    return scale, phase
+
+
+@lru_cache(maxsize=8)
+def cached_transform_matrix(M: int) -> np.array:
+    """Returns the read-only M x M forward DCT transform matrix, keeping
+    the most recently used sizes in memory."""
+    t = get_transform_matrix(M)
+    t.flags.writeable = False
+    return t
+
+
+def separable_matmul(A: np.array, g: np.array, B: np.array,
+        workers: int = 1) -> np.array:
+    """Performs AgBt, where At is the transpose of A, transforming each
+    channel of g independently. The columns and then the rows of g are
+    split into bands shared by workers threads."""
+    shape = g.shape
+    g = np.asarray(g, dtype=np.float64).reshape(shape[0], -1)
+    
+    t = np.empty(g.shape)
+    def columns(start, stop):
+        np.matmul(A, g[:, start:stop], out=t[:, start:stop])
+    run_bands(columns, g.shape[1], workers)
+    
+    t = t.reshape(shape[0], shape[1], -1)
+    G = np.empty(t.shape)
+    def rows(start, stop):
+        np.matmul(B, t[start:stop], out=G[start:stop])
+    run_bands(rows, shape[0], workers)
+    
+    return G.reshape(shape)
+
+
+def block_matmul(A: np.array, B: np.array, pad_mode: str = 'edge',
+        workers: int = 1) -> np.array:
+    """Performs ABiAt for every block Bi of B with the same size as A, where
+    At is the transpose of A.
+    
+    B is first padded to a whole number of blocks with np.pad's pad_mode,
+    or cropped to one if pad_mode is None. Each direction is then a single
+    batched product over a reshaped view of B, with colour channels
+    carried along. Rows of blocks are split into bands shared by workers
+    threads."""
     if A.ndim != 2:
         raise ValueError("Invalid transform")
-    
-    if B.ndim == 3:
-        channels = B.transpose(2, 0, 1)
-        channels_dct = np.array([crop_matmul(A, c) for c in channels])
-        return channels_dct.transpose(1, 2, 0)
-    elif B.ndim != 2:
+    if B.ndim not in (2, 3):
         raise ValueError("Invalid image")
     
-    Bs, As = np.array([B.shape, A.shape])
+    M = A.shape[0]
+    B = pad_blocks(B, M, pad_mode)
+    shape = B.shape
+    channels = int(np.prod(shape[2:]))
+    G = np.empty(shape)
     
-    q = Bs // As
+    def band(start, stop):
+        rows = slice(start * M, stop * M)
+        X = np.asarray(B[rows], dtype=np.float64)
+        
+        #Columns of every block: (rows, M, cols * M * channels).
+        X = np.matmul(A, X.reshape(stop - start, M, -1))
+        
+        #Rows of every block: (rows * M * cols, M, channels).
+        X = np.matmul(A, X.reshape(-1, M, channels))
+        
+        G[rows] = X.reshape(G[rows].shape)
     
-    vn, hn = q
-    vs, hs = As * q
-    B = B[:vs, :hs]
+    run_bands(band, shape[0] // M, workers, max(1, 2048 // M))
+    return G
+
+
+def pad_blocks(B: np.array, M: int, pad_mode: str = 'edge') -> np.array:
+    """Pads B to a whole number of M x M blocks with np.pad's pad_mode, or
+    crops it to one if pad_mode is None."""
+    H, W = B.shape[:2]
+    if pad_mode is None:
+        return B[:H - H % M, :W - W % M]
+    elif H % M or W % M:
+        pad = [(0, -H % M), (0, -W % M)] + [(0, 0)] * (B.ndim - 2)
+        return np.pad(B, pad, mode=pad_mode)
+    return B
+
+
+def fixed_block_dct(B: np.array, forward: bool, pad_mode: str = 'edge',
+        workers: int = 1) -> np.array:
+    """Performs a forward or inverse DTC on every 8 x 8 block of B with the
+    fixed-point kernels from fixed_dct, padding B like block_matmul, and
+    returns int16 coefficients or pixels.
+    
+    Each chunk of about fixed_dct.CHUNK_BLOCKS blocks is gathered into the
+    8 x 8 x N layout used by the kernels and its result scattered straight
+    into the output, so the temporaries stay in cache."""
+    if B.ndim not in (2, 3):
+        raise ValueError("Invalid image")
     
-    split = np.split(B, vn) 
-    split = [np.split(i, hn, 1) for i in split]
+    f = fixed_dct.fdct_chunk if forward else fixed_dct.idct_chunk
+    B = pad_blocks(B, 8, pad_mode)
+    shape = B.shape
+    G = np.empty(shape, dtype=np.int16)
+    blocks_per_row = shape[1] // 8 * int(np.prod(shape[2:]))
+    chunk_rows = max(1, fixed_dct.CHUNK_BLOCKS // max(blocks_per_row, 1))
     
-    split = [[np.matmul(A, i) for i in j] for j in split]
-    split = [[np.matmul(i, A.transpose()) for i in j] for j in split]
+    def band(start, stop):
+        for row in range(start, stop, chunk_rows):
+            rows = slice(row * 8, min(row + chunk_rows, stop) * 8)
+            n = (rows.stop - rows.start) // 8
+            view = (n, 8, shape[1] // 8, 8, -1)
+            blocks = B[rows].reshape(view).transpose(1, 3, 0, 2, 4)
+            result = f(np.ascontiguousarray(blocks).reshape(8, 8, -1))
+            G[rows].reshape(view)[...] = result.reshape(
+                blocks.shape).transpose(2, 0, 3, 1, 4)
     
-    return np.block(split)
+    run_bands(band, shape[0] // 8, workers)
+    return G
 
 
-def fdct(g: np.array, matrix_size: int = 0) -> np.array:
-    """Performs a forward DTC on an image."""
-    if matrix_size > 0:
-        A = get_transform_matrix(matrix_size)
-        G = crop_matmul(A, g)
+def fdct(g: np.array, matrix_size: int = 0, method: str = 'matrix',
+        pad_mode: str = 'edge', workers: int = 1,
+        precision: str = 'float') -> np.array:
+    """Performs a forward DTC on an image. The method is only used for the
+    full image transform (see dct), and pad_mode only for the block
+    transform (see block_matmul). Integer precision uses the fixed-point
+    kernel of fixed_dct, for 8 x 8 blocks of 8-bit images only."""
+    if precision == 'int':
+        if matrix_size != 8:
+            raise ValueError("Integer precision requires a matrix size of 8")
+        G = fixed_block_dct(g, True, pad_mode, workers)
+        
+    elif matrix_size > 0:
+        A = cached_transform_matrix(matrix_size)
+        G = block_matmul(A, g, pad_mode, workers)
         
     else:
-        G = dct(g, True)
+        G = dct(g, True, method, workers)
     
     return G
 
 
-def idct(G: np.array, matrix_size: int = 0) -> np.array:
-    """Performs a reverse DTC on an image."""
-    if matrix_size > 0:
-        At = get_transform_matrix(matrix_size).transpose()
-        g = crop_matmul(At, G)
+def idct(G: np.array, matrix_size: int = 0, method: str = 'matrix',
+        pad_mode: str = 'edge', workers: int = 1,
+        precision: str = 'float') -> np.array:
+    """Performs a reverse DTC on an image. The method is only used for the
+    full image transform (see dct), and pad_mode only for the block
+    transform (see block_matmul). Integer precision uses the fixed-point
+    kernel of fixed_dct, for 8 x 8 blocks of integer coefficients only."""
+    if precision == 'int':
+        if matrix_size != 8:
+            raise ValueError("Integer precision requires a matrix size of 8")
+        g = fixed_block_dct(G, False, pad_mode, workers)
+        
+    elif matrix_size > 0:
+        At = cached_transform_matrix(matrix_size).transpose()
+        g = block_matmul(At, G, pad_mode, workers)
         
     else:
-        g = dct(G, True)
+        g = dct(G, False, method, workers)
     
     return g
 
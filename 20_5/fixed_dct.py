@@ -0,0 +1,182 @@
+"""Fixed-point 8 x 8 forward and inverse DCTs using only int32 arithmetic.
+
+Both transforms follow the scaled factorization of Arai, Agui and Nakajima
+(as in the IJG's jfdctfst.c and jidctfst.c), vectorized across any number
+of blocks, with the AAN scale factors folded into a single fixed-point
+multiplication per coefficient. Blocks are laid out as 8 x 8 x N arrays
+and processed in chunks small enough for the temporaries to stay in cache.
+Results are int16, which holds every coefficient of an 8-bit block
+(|G| <= 2040) and every reconstructed pixel.
+
+Maximum error against the float path (block_matmul), measured over
+random, binary, constant, gradient and checkerboard 8-bit blocks:
+- fdct_8x8 rounds the orthonormal coefficients to integers and is never
+  more than 0.75 away from the float coefficients (0.5 of which is the
+  rounding itself).
+- idct_8x8 rounds the pixels to integers and is never more than 0.85 away
+  from the float inverse of the same integer coefficients.
+The largest intermediate stays below a third of the int32 range for those
+inputs; coefficients far outside what an 8-bit block can produce may
+overflow."""
+import numpy as np
+
+CHUNK_BLOCKS = 1024
+
+CONST_BITS = 13
+PASS1_BITS = 4
+SCALE_BITS = 18
+
+
+def fix(x: float) -> int:
+    """Returns x as a fixed-point constant with CONST_BITS fractional bits."""
+    return int(round(x * (1 << CONST_BITS)))
+
+
+FIX_0_382683433 = fix(0.382683433)
+FIX_0_541196100 = fix(0.541196100)
+FIX_0_707106781 = fix(0.707106781)
+FIX_1_082392200 = fix(1.082392200)
+FIX_1_306562965 = fix(1.306562965)
+FIX_1_414213562 = fix(1.414213562)
+FIX_1_847759065 = fix(1.847759065)
+FIX_2_613125930 = fix(2.613125930)
+
+#AAN scale factors: the 1D factorization returns sqrt(8) AAN_SCALE[k] X[k].
+AAN_SCALE = np.array([1] + [np.cos(k * np.pi / 16) * np.sqrt(2)
+    for k in range(1, 8)])
+AAN_SCALE_2D = np.outer(AAN_SCALE, AAN_SCALE)[..., np.newaxis]
+
+#Turns the scaled output of the forward transform into orthonormal
+#coefficients with SCALE_BITS fractional bits.
+FDCT_SCALE = np.rint(
+    2**SCALE_BITS / (8 * AAN_SCALE_2D * 2**PASS1_BITS)).astype(np.int32)
+
+#Scales orthonormal coefficients for the inverse transform, with
+#CONST_BITS fractional bits.
+IDCT_SCALE = np.rint(AAN_SCALE_2D * 2**CONST_BITS).astype(np.int32)
+
+
+def descale(x: np.array, n: int) -> np.array:
+    """Divides x by 2^n, rounding to the nearest integer."""
+    return (x + (1 << (n - 1))) >> n
+
+
+def multiply(x: np.array, c: int) -> np.array:
+    """Multiplies x by a fixed-point constant."""
+    return descale(x * c, CONST_BITS)
+
+
+def fdct_1d(d: list) -> list:
+    """Performs the scaled 1D forward AAN DCT on a list of 8 arrays."""
+    tmp0 = d[0] + d[7]
+    tmp7 = d[0] - d[7]
+    tmp1 = d[1] + d[6]
+    tmp6 = d[1] - d[6]
+    tmp2 = d[2] + d[5]
+    tmp5 = d[2] - d[5]
+    tmp3 = d[3] + d[4]
+    tmp4 = d[3] - d[4]
+    
+    #Even part.
+    tmp10 = tmp0 + tmp3
+    tmp13 = tmp0 - tmp3
+    tmp11 = tmp1 + tmp2
+    tmp12 = tmp1 - tmp2
+    z1 = multiply(tmp12 + tmp13, FIX_0_707106781)
+    
+    #Odd part.
+    tmp10_odd = tmp4 + tmp5
+    tmp11_odd = tmp5 + tmp6
+    tmp12_odd = tmp6 + tmp7
+    z5 = multiply(tmp10_odd - tmp12_odd, FIX_0_382683433)
+    z2 = multiply(tmp10_odd, FIX_0_541196100) + z5
+    z4 = multiply(tmp12_odd, FIX_1_306562965) + z5
+    z3 = multiply(tmp11_odd, FIX_0_707106781)
+    z11 = tmp7 + z3
+    z13 = tmp7 - z3
+    
+    return [tmp10 + tmp11, z11 + z4, tmp13 + z1, z13 - z2,
+        tmp10 - tmp11, z13 + z2, tmp13 - z1, z11 - z4]
+
+
+def idct_1d(d: list) -> list:
+    """Performs the scaled 1D inverse AAN DCT on a list of 8 arrays."""
+    #Even part.
+    tmp10 = d[0] + d[4]
+    tmp11 = d[0] - d[4]
+    tmp13 = d[2] + d[6]
+    tmp12 = multiply(d[2] - d[6], FIX_1_414213562) - tmp13
+    tmp0 = tmp10 + tmp13
+    tmp3 = tmp10 - tmp13
+    tmp1 = tmp11 + tmp12
+    tmp2 = tmp11 - tmp12
+    
+    #Odd part.
+    z13 = d[5] + d[3]
+    z10 = d[5] - d[3]
+    z11 = d[1] + d[7]
+    z12 = d[1] - d[7]
+    tmp7 = z11 + z13
+    tmp11 = multiply(z11 - z13, FIX_1_414213562)
+    z5 = multiply(z10 + z12, FIX_1_847759065)
+    tmp10 = multiply(z12, FIX_1_082392200) - z5
+    tmp12 = multiply(z10, -FIX_2_613125930) + z5
+    tmp6 = tmp12 - tmp7
+    tmp5 = tmp11 - tmp6
+    tmp4 = tmp10 + tmp5
+    
+    return [tmp0 + tmp7, tmp1 + tmp6, tmp2 + tmp5, tmp3 - tmp4,
+        tmp3 + tmp4, tmp2 - tmp5, tmp1 - tmp6, tmp0 - tmp7]
+
+
+def separable(f, blocks: np.array) -> np.array:
+    """Applies a 1D transform along the first and then the second axis of
+    an 8 x 8 x N array of blocks."""
+    columns = np.stack(f([blocks[k] for k in range(8)]), axis=0)
+    return np.stack(f([columns[:, k] for k in range(8)]), axis=1)
+
+
+def by_chunks(f, blocks: np.array) -> np.array:
+    """Applies f to CHUNK_BLOCKS blocks at a time of an 8 x 8 x N array,
+    returning an int16 array."""
+    out = np.empty(blocks.shape, dtype=np.int16)
+    for start in range(0, blocks.shape[2], CHUNK_BLOCKS):
+        chunk = slice(start, start + CHUNK_BLOCKS)
+        out[:, :, chunk] = f(blocks[:, :, chunk])
+    return out
+
+
+def fdct_chunk(chunk: np.array) -> np.array:
+    """Returns the orthonormal DCT of an 8 x 8 x N array of 8-bit blocks,
+    rounded to int16. N should be small enough for the temporaries to stay
+    in cache."""
+    #Level shift, keeping PASS1_BITS fractional bits between passes.
+    g = (chunk.astype(np.int32) - 128) << PASS1_BITS
+    G = descale(separable(fdct_1d, g) * FDCT_SCALE, SCALE_BITS)
+    
+    #Undoes the level shift, which only affects the DC coefficient.
+    G[0, 0] += 1024
+    return G.astype(np.int16)
+
+
+def idct_chunk(chunk: np.array) -> np.array:
+    """Returns the pixels of an 8 x 8 x N array of blocks of integer
+    orthonormal DCT coefficients, rounded to int16. N should be small
+    enough for the temporaries to stay in cache."""
+    G = chunk.astype(np.int32)
+    G[0, 0] -= 1024
+    G = descale(G * IDCT_SCALE, CONST_BITS - PASS1_BITS)
+    g = descale(separable(idct_1d, G), PASS1_BITS + 3) + 128
+    return g.astype(np.int16)
+
+
+def fdct_8x8(blocks: np.array) -> np.array:
+    """Returns the orthonormal DCT of an 8 x 8 x N array of 8-bit blocks,
+    rounded to int16."""
+    return by_chunks(fdct_chunk, blocks)
+
+
+def idct_8x8(blocks: np.array) -> np.array:
+    """Returns the pixels of an 8 x 8 x N array of blocks of integer
+    orthonormal DCT coefficients, rounded to int16."""
+    return by_chunks(idct_chunk, blocks)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Indexes images by a DCT based perceptual hash and finds near-duplicates
+of an image in the index."""
+import argparse
+import os
+from functools import lru_cache
+import cv2 as cv
+import e20_4 as transform
+import numpy as np
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__)
+    parser.add_argument(
+        'operation',
+        metavar='operation',
+        choices=['add', 'query'],
+        help='whether images are added to the index or looked up in it '
+            '(%(choices)s)')
+    parser.add_argument(
+        'index_path',
+        metavar='index',
+        help='the directory holding the index')
+    parser.add_argument(
+        'in_paths',
+        metavar='in',
+        nargs='+',
+        help='the images to be processed')
+    parser.add_argument(
+        '-r', '--radius',
+        dest='radius',
+        type=int,
+        default=6,
+        help='the largest Hamming distance of a match (default: %(default)s)')
+
+    args = parser.parse_args()
+    
+    images = [cv.imread(path, cv.IMREAD_GRAYSCALE) for path in args.in_paths]
+    hashes = perceptual_hashes(images)
+    index = HashIndex(args.index_path)
+    
+    if args.operation == 'add':
+        index.add(hashes, args.in_paths)
+    else:
+        for path, h in zip(args.in_paths, hashes):
+            print(f"{path}:")
+            ids, distances = index.query(h, args.radius)
+            for i, d in sorted(zip(ids, distances), key=lambda m: m[1]):
+                print(f"  {d:2d} {index.names[i]}")
+
+
+#Side of the downscaled image and of the block of coefficients kept.
+HASH_SIZE = 32
+HASH_COEFFICIENTS = 8
+
+#Number of set bits in each byte.
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(x: np.array) -> np.array:
+    """Returns the number of set bits of each element of a uint64 array."""
+    x = np.asarray(x, dtype=np.uint64)
+    counts = POPCOUNT[x.reshape(-1).view(np.uint8)]
+    return counts.reshape(x.shape + (8,)).sum(axis=-1)
+
+
+def low_frequency_dct(images: np.array, K: int) -> np.array:
+    """Returns the K x K lowest frequency DCT coefficients of a stack of
+    square images, using only the first K rows of the transform matrix."""
+    T = transform.cached_transform_matrix(images.shape[-1])[:K]
+    return np.matmul(np.matmul(T, images), T.transpose())
+
+
+def perceptual_hashes(images: list) -> np.array:
+    """Returns the 64-bit perceptual hashes of a list of images.
+    
+    Each image is reduced to a 32 x 32 grayscale image, and each bit of its
+    hash tells whether one of its 8 x 8 lowest frequency coefficients is
+    above their median, ignoring the DC coefficient."""
+    size = (HASH_SIZE, HASH_SIZE)
+    small = np.empty((len(images),) + size)
+    for i, image in enumerate(images):
+        if image.ndim == 3:
+            image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+        small[i] = cv.resize(image, size, interpolation=cv.INTER_AREA)
+    
+    G = low_frequency_dct(small, HASH_COEFFICIENTS).reshape(len(images), -1)
+    median = np.median(G[:, 1:], axis=1)
+    bits = G > median[:, np.newaxis]
+    return np.packbits(bits, axis=1).view('>u8').ravel().astype(np.uint64)
+
+
+class HashIndex:
+    """On-disk index of 64-bit hashes, searched by multi-index hashing.
+    
+    Each hash is split into 4 chunks of 16 bits, and every chunk has a
+    sorted table. Two hashes within a distance r must have a chunk within
+    r // 4 of each other, so a query only has to verify the entries whose
+    chunks are near its own."""
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.exists(self._file('hashes.npy')):
+            self.hashes = np.load(self._file('hashes.npy'), mmap_mode='r')
+            self.keys = np.load(self._file('keys.npy'), mmap_mode='r')
+            self.order = np.load(self._file('order.npy'), mmap_mode='r')
+            with open(self._file('names.txt'), encoding='utf-8') as f:
+                self.names = f.read().splitlines()
+        else:
+            self.hashes = np.empty(0, dtype=np.uint64)
+            self.keys = np.empty((self.CHUNKS, 0), dtype=np.uint16)
+            self.order = np.empty((self.CHUNKS, 0), dtype=np.int64)
+            self.names = []
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(self, hashes: np.array, names: list) -> None:
+        """Adds hashes with their names to the index and saves it,
+        rebuilding the chunk tables once for the whole batch."""
+        if len(hashes) != len(names):
+            raise ValueError("There must be one name per hash")
+        
+        self.hashes = np.concatenate((self.hashes, hashes)).astype(np.uint64)
+        self.names = self.names + list(names)
+        chunks = self.chunks(self.hashes)
+        self.order = np.argsort(chunks, axis=1, kind='stable')
+        self.keys = np.take_along_axis(chunks, self.order, axis=1)
+        self.save()
+
+    def save(self) -> None:
+        """Writes the index to its directory."""
+        os.makedirs(self.path, exist_ok=True)
+        np.save(self._file('hashes.npy'), self.hashes)
+        np.save(self._file('keys.npy'), self.keys)
+        np.save(self._file('order.npy'), self.order)
+        with open(self._file('names.txt'), 'w', encoding='utf-8') as f:
+            f.writelines(f"{name}\n" for name in self.names)
+
+    def query(self, h: int, radius: int) -> (np.array, np.array):
+        """Returns the ids of the hashes within a Hamming distance radius
+        of h, and their distances."""
+        h = np.uint64(h)
+        masks = chunk_masks(radius // self.CHUNKS, self.CHUNK_BITS)
+        
+        candidates = []
+        for i, chunk in enumerate(self.chunks(np.array([h]))[:, 0]):
+            values = chunk ^ masks
+            start = np.searchsorted(self.keys[i], values, 'left')
+            lengths = np.searchsorted(self.keys[i], values, 'right') - start
+            
+            #Positions of every entry in the ranges [start, start + length).
+            ends = np.cumsum(lengths)
+            positions = np.arange(ends[-1]) + np.repeat(start - ends + lengths,
+                lengths)
+            candidates.append(self.order[i][positions])
+        ids = np.unique(np.concatenate(candidates))
+        distances = popcount(self.hashes[ids] ^ h).astype(np.int64)
+        close = distances <= radius
+        return ids[close], distances[close]
+
+    def chunks(self, hashes: np.array) -> np.array:
+        """Returns the CHUNKS x N chunks of an array of hashes."""
+        shifts = np.arange(self.CHUNKS, dtype=np.uint64) * self.CHUNK_BITS
+        mask = np.uint64(2 ** self.CHUNK_BITS - 1)
+        chunks = (hashes[np.newaxis] >> shifts[:, np.newaxis]) & mask
+        return chunks.astype(np.uint16)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+
+@lru_cache(maxsize=None)
+def chunk_masks(radius: int, bits: int) -> np.array:
+    """Returns every value of a chunk with at most radius set bits."""
+    values = np.arange(2 ** bits, dtype=np.uint64)
+    masks = values[popcount(values) <= radius].astype(np.uint16)
+    masks.flags.writeable = False
+    return masks
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,7 @@
 """Mirror an image horizontally, vertically, or both."""
 import argparse
 from enum import Enum, auto
+import geometry
 from PIL import Image
 
 
@@ -22,12 +23,14 @@ def main():
         help='where the processed image will be saved')
     args = parser.parse_args()
     
+    #Composes the mirrors so the pixels are only copied once.
     image = Image.open(args.in_image)
+    transform = geometry.from_image(image)
     if args.operation in ('horizontal', 'both'):
-        image = mirror_horizontal(image)
+        transform.flip_horizontal()
     if args.operation in ('vertical', 'both'):
-        image = mirror_vertical(image)
-    image.save(args.out_image)
+        transform.flip_vertical()
+    geometry.to_image(transform, image).save(args.out_image)
 
 
 class MirrorMode(Enum):
@@ -37,27 +40,13 @@ class MirrorMode(Enum):
 
 def mirror_generic(image: Image, mirror_type: MirrorMode) -> Image:
     """Returns a new image that's mirrored vertically or horizontally"""
-    #Generates the new data.
-    w, h = image.size
-    data = list(image.getdata())
-    new_data = []
-    for y in range(h):
-        for x in range(w):
-            if mirror_type is MirrorMode.HORIZONTAL:
-                x2 = w - x - 1
-                i = w * y + x2
-            else:
-                y2 = h - y - 1
-                i = w * y2 + x
-            new_data.append(data[i])
-
-    #Flattens the new data if necessary and turn it into bytes.
-    if type(new_data[0]) is tuple:
-        new_data = bytes(c for p in new_data for c in p)
+    transform = geometry.from_image(image)
+    if mirror_type is MirrorMode.HORIZONTAL:
+        transform.flip_horizontal()
     else:
-        new_data = bytes(new_data)
+        transform.flip_vertical()
 
-    new_image = Image.frombytes(image.mode, image.size, new_data)
+    new_image = geometry.to_image(transform, image)
     
     return new_image
 
@@ -67,7 +56,7 @@ def mirror_horizontal(image: Image) -> Image:
     #Using Pillow methods (fast):
     #new_image = image.transpose(Image.FLIP_LEFT_RIGHT)
 
-    #Doing it manually (slow):
+    #Doing it manually:
     new_image = mirror_generic(image, MirrorMode.HORIZONTAL)
 
     return new_image
@@ -78,7 +67,7 @@ def mirror_vertical(image: Image) -> Image:
     #Using Pillow methods (fast):
     #new_image = image.transpose(Image.FLIP_TOP_BOTTOM)
 
-    #Doing it manually (slow):
+    #Doing it manually:
     new_image = mirror_generic(image, MirrorMode.VERTICAL)
     
     return new_image
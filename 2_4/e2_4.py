@@ -1,7 +1,20 @@
 #!/usr/bin/env python3
 """Paints a 10 x 10 pixels white frame in the top left corner of the image."""
 import argparse
-from PIL import Image, ImageDraw
+import numpy as np
+import os
+import pixels
+import shutil
+from PIL import Image
+
+
+#Area painted by paint_frame, as (left, upper, right, lower), exclusive.
+FRAME_BOX = (0, 0, 10, 10)
+FRAME_COLOR = (255, 255, 255)
+
+#Largest value of the modes with more than 8 bits per sample. A color's
+#gray level is scaled from 0-255 to these.
+HIGH_BIT_MAXIMUMS = {'I;16': 65535, 'I;16B': 65535, 'I': 65535}
 
 
 def main():
@@ -9,34 +22,110 @@ def main():
     parser.add_argument(
         'in_image',
         metavar='in',
-        help='the image to be processed')
+        help='the image to be processed; with --batch, a directory or a '
+            'glob pattern')
     parser.add_argument(
         'out_image',
         metavar='out',
-        help='where the processed image will be saved')
+        help='where the processed image will be saved; with --batch, a '
+            'directory')
+    parser.add_argument(
+        '-b', '--batch',
+        action='store_true',
+        dest='batch',
+        help='paints every image in a directory or glob pattern, patching '
+            'uncompressed files without decoding them')
     args = parser.parse_args()
     
+    if args.batch:
+        batch(args.in_image, args.out_image)
+        return
+    
     image = Image.open(args.in_image)
-    image = paint_frame(image)
+    paint_region(image, FRAME_BOX, FRAME_COLOR)
     image.save(args.out_image)
 
 
+def native_color(image: Image, color: tuple, palette: list = None):
+    """Returns the pixel value of an RGB color in the mode of the image.
+    For P images, the index of the nearest entry of palette, which is read
+    from the image (loading its pixels) if not given."""
+    color = tuple(min(max(int(c), 0), 255) for c in color)
+    if image.mode == 'P':
+        if palette is None:
+            palette = image.getpalette()
+        palette = np.array(palette[:768], dtype=int).reshape(-1, 3)
+        distances = ((palette - color) ** 2).sum(axis=1)
+        return int(distances.argmin())
+    if image.mode in HIGH_BIT_MAXIMUMS:
+        gray = Image.new('RGB', (1, 1), color).convert('L').getpixel((0, 0))
+        return gray * HIGH_BIT_MAXIMUMS[image.mode] // 255
+    return Image.new('RGB', (1, 1), color).convert(image.mode).getpixel((0, 0))
+
+
+def clip_box(box: tuple, size: (int, int)) -> tuple:
+    """Returns the part of a box that lies inside an image of the given
+    size."""
+    w, h = size
+    left, upper, right, lower = box
+    return (min(max(left, 0), w), min(max(upper, 0), h),
+            min(max(right, 0), w), min(max(lower, 0), h))
+
+
+def paint_region(image: Image, box: tuple, color: tuple) -> None:
+    """Fills a box of the image with an RGB color in place, in the image's
+    own mode, touching only the pixels inside the box."""
+    box = clip_box(box, image.size)
+    image.paste(native_color(image, color), box)
+
+
 def paint_frame(image: Image) -> Image:
     """Returns a new image with a 10 x 10 pixels white frame painted on its top left corner."""
-    #Converts the image to RGB for processing.
-    original_mode = image.mode
-    new_image = image.convert("RGB")
-    
-    #Paints the frame.
-    draw = ImageDraw.Draw(new_image)
-    box = (0, 0, 9, 9)
-    color = (255, 255, 255)
-    draw.rectangle(box, fill=color)
-    
-    #Converts the image back to the original mode and returns it.
-    new_image = new_image.convert(original_mode)
+    new_image = image.copy()
+    paint_region(new_image, FRAME_BOX, FRAME_COLOR)
     return new_image
 
 
+def patch_file(in_path: str, out_path: str, box: tuple, color: tuple) -> bool:
+    """Copies an image file and fills a box of the copy with a color by
+    writing the file's pixel bytes directly. Returns False, without
+    writing anything, if the file doesn't store its pixels uncompressed."""
+    with Image.open(in_path) as image:
+        layout = pixels.raw_layout(image)
+        if layout is None:
+            return False
+        #getpalette would decode every pixel, so the header's is used.
+        palette = pixels.header_palette(image)
+        if image.mode == 'P' and palette is None:
+            return False
+        value = native_color(image, color, palette)
+        size = image.size
+    
+    shutil.copyfile(in_path, out_path)
+    array = pixels.raw_array(out_path, size, layout, 'r+')
+    left, upper, right, lower = clip_box(box, size)
+    region = array[upper:lower, left:right]
+    if array.ndim == 2:
+        region[...] = value
+    else:
+        order = pixels.RAW_MODES[layout[1]][2]
+        region[..., order] = np.atleast_1d(value)[:len(order)]
+    array.flush()
+    return True
+
+
+def batch(in_pattern: str, out_dir: str, box: tuple = FRAME_BOX,
+        color: tuple = FRAME_COLOR) -> None:
+    """Paints a box on every image in a directory or glob pattern, saving
+    the results with the same names in out_dir."""
+    os.makedirs(out_dir, exist_ok=True)
+    for path in pixels.find_images(in_pattern):
+        out_path = os.path.join(out_dir, os.path.basename(path))
+        if not patch_file(path, out_path, box, color):
+            with Image.open(path) as image:
+                paint_region(image, box, color)
+                image.save(out_path)
+
+
 if __name__ == '__main__':
     main()
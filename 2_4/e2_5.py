@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 """Sums and displays the pixel values of a grayscale image."""
 import argparse
+import numpy as np
+import pixels
+import reduction
 from PIL import Image, ImageDraw
 
 
@@ -10,20 +13,38 @@ def main():
         'in_image',
         metavar='in',
         help='the image to be processed')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        dest='stream',
+        help='reads the image (or an NPY array) in strips, for images that '
+            "don't fit in memory")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='number of threads reducing strips with --stream '
+            '(default: %(default)d)')
     args = parser.parse_args()
     
-    image = Image.open(args.in_image)
-    result = count_values(image)
+    if args.stream:
+        result = reduction.count_values(args.in_image, args.workers)
+    else:
+        image = Image.open(args.in_image)
+        result = count_values(image)
     print(f"Result: {result}")
 
 
 def count_values(image: Image) -> int:
-    """Returns the sum of all pixel values in a grayscale image."""
+    """Returns the sum of the pixel values of an image converted to 8-bit
+    grayscale (L) by Pillow, so 16-bit and float samples are clipped to
+    0-255. reduction.count_values gives the same result with --stream."""
     #Converts the image to 8-bit grayscale for processing.
-    image = image.convert("L")
+    if image.mode != "L":
+        image = image.convert("L")
     
     #Sums the values.
-    result = sum(list(image.getdata()))
+    result = int(pixels.as_array(image).sum(dtype=np.uint64))
     
     return result
 
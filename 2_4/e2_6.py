@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """Finds and displays the minimum and maximum pixel values of a grayscale image."""
 import argparse
+import pixels
+import reduction
 from PIL import Image, ImageDraw
 from collections import namedtuple
 
@@ -11,10 +13,25 @@ def main():
         'in_image',
         metavar='in',
         help='the image to be processed')
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        dest='stream',
+        help='reads the image (or an NPY array) in strips, for images that '
+            "don't fit in memory")
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='number of threads reducing strips with --stream '
+            '(default: %(default)d)')
     args = parser.parse_args()
     
-    image = Image.open(args.in_image)
-    pair = find_min_max(image)
+    if args.stream:
+        pair = MinMaxPair(*reduction.find_min_max(args.in_image, args.workers))
+    else:
+        image = Image.open(args.in_image)
+        pair = find_min_max(image)
     print(f"Min: {pair.min}")
     print(f"Max: {pair.max}")
 
@@ -22,14 +39,18 @@ def main():
 MinMaxPair = namedtuple("MinMaxPair", "min max")
 
 def find_min_max(image: Image) -> MinMaxPair:
-    """Returns the minimum and maximum pixel values of a grayscale image."""
+    """Returns the minimum and maximum pixel values of an image converted
+    to 8-bit grayscale (L) by Pillow, so 16-bit and float samples are
+    clipped to 0-255. reduction.find_min_max gives the same result with
+    --stream."""
     #Converts the image to 8-bit grayscale for processing.
-    image = image.convert("L")
+    if image.mode != "L":
+        image = image.convert("L")
     
     #Finds the values.
-    data = list(image.getdata())
-    pixel_min = min(data)
-    pixel_max = max(data)
+    data = pixels.as_array(image)
+    pixel_min = int(data.min())
+    pixel_max = int(data.max())
     pair = MinMaxPair(pixel_min, pixel_max)
     
     return pair
@@ -3,7 +3,24 @@
 until the original state is reached again."""
 import argparse
 import cv2 as cv
-from numpy import concatenate, ndarray
+import geometry
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from math import ceil, floor
+from numpy import concatenate, ndarray, roll
+from queue import Queue
+
+#Finest fraction of a pixel a step can have. Each distinct fraction of a
+#pixel reached by the shifts costs one interpolated copy of the image.
+MAX_PHASES = 16
+
+#Frames generated ahead of the encoder.
+QUEUE_FRAMES = 8
 
 
 def main():
@@ -15,6 +32,23 @@ def main():
         type=float,
         default=10,
         help='how long the video should be, in seconds (default: %(default).1f)')
+    parser.add_argument(
+        '--direction',
+        choices=['right', 'left', 'down', 'up'],
+        default='right',
+        help='where the image moves (%(choices)s; default: %(default)s)')
+    parser.add_argument(
+        '--step',
+        type=parse_step,
+        default=Fraction(1),
+        help='pixels moved by each shift; fractions such as 0.5 or 1/3 '
+            f'interpolate, down to 1/{MAX_PHASES} (default: %(default)s)')
+    parser.add_argument(
+        '--segments',
+        type=int,
+        default=1,
+        help='number of processes encoding consecutive parts of the video, '
+            'joined without re-encoding by ffmpeg (default: %(default)d)')
     parser.add_argument(
         'in_image',
         metavar='in',
@@ -26,42 +60,182 @@ def main():
     args = parser.parse_args()
 
     image = cv.imread(args.in_image)
-    create_video(args.out_video, image, args.duration)
+    create_video(args.out_video, image, args.duration,
+        direction=args.direction, step=args.step, segments=args.segments)
+
+
+def parse_step(text: str) -> Fraction:
+    """Parses a positive step in pixels, rounded to 1/MAX_PHASES."""
+    try:
+        step = Fraction(text).limit_denominator(MAX_PHASES)
+    except (ValueError, ZeroDivisionError):
+        raise argparse.ArgumentTypeError(f"invalid step: {text}")
+    if step <= 0:
+        raise argparse.ArgumentTypeError(f"invalid step: {text}")
+    return step
 
 
 def shift_right(array: ndarray) -> ndarray:
     """Shifts the array one column to the right, wrapping around the column
     that gets pushed out."""
-    new_array = array.swapaxes(0, 1)
-    #Head and tail of the new array == tail and head of the original array.
-    head = new_array[-1:]
-    tail = new_array[:-1]
-    new_array = concatenate([head, tail])
-    new_array = new_array.swapaxes(0, 1)
-    return new_array
+    return geometry.Transform(array).shift(0, 1).materialize()
+
+
+class ShiftedFrames:
+    """Circular shifts of an image along one axis, returned as windows into
+    a copy of the image doubled along that axis, so producing a frame
+    doesn't copy any pixels.
+    
+    Shifts by a fraction of a pixel use a doubled copy of the image
+    interpolated once for that fraction and cached."""
+
+    def __init__(self, image: ndarray, axis: int = 1):
+        self.image = image
+        self.axis = axis
+        self.length = image.shape[axis]
+        self.phases = {}
+
+    def doubled(self, phase: Fraction) -> ndarray:
+        """Returns the doubled image shifted by a fraction of a pixel."""
+        if phase not in self.phases:
+            image = self.image
+            if phase:
+                #Linear interpolation between each pixel and the previous one.
+                previous = roll(image, 1, self.axis)
+                image = cv.addWeighted(
+                    image, float(1 - phase), previous, float(phase), 0)
+            self.phases[phase] = concatenate([image, image], self.axis)
+        return self.phases[phase]
+
+    def frame(self, offset: Fraction) -> ndarray:
+        """Returns the image shifted circularly by offset pixels towards the
+        end of the axis (right or down); negative offsets go the other way."""
+        offset = Fraction(offset) % self.length
+        whole = floor(offset)
+        start = self.length - whole
+        window = slice(start, start + self.length)
+        doubled = self.doubled(offset - whole)
+        return doubled[:, window] if self.axis == 1 else doubled[window]
+
+
+def frame_offsets(image_shape: tuple, total_frames: int, direction: str,
+        step: Fraction, start: int, stop: int) -> (int, list):
+    """Returns the shift axis and the offset of each of the frames from
+    start to stop of a video with total_frames frames."""
+    #Calculates the duration, in frames, of each image.
+    #Repeats the initial state at the beginning and the end
+    axis = 0 if direction in ('down', 'up') else 1
+    sign = -1 if direction in ('left', 'up') else 1
+    length = image_shape[axis]
+    total_shifts = Fraction(length) / Fraction(step)
+
+    #Shifts the image based on the fraction of the video written. When the
+    #step doesn't divide the length, the last shift is shorter, so the
+    #video still ends on the original image.
+    offsets = []
+    for frame in range(start, stop):
+        shift_count = ceil((frame + 1) * total_shifts / total_frames)
+        offsets.append(sign * min(shift_count * step, length))
+    return axis, offsets
+
+
+def produce_frames(frames: ShiftedFrames, offsets: list, queue: Queue,
+        errors: list) -> None:
+    """Puts the frames with the given offsets in a queue, followed by None.
+    The frames are windows into the doubled image, which OpenCV reads
+    without copying, and consecutive frames with the same offset are the
+    same window."""
+    try:
+        previous = None
+        for offset in offsets:
+            if previous is None or offset != previous:
+                frame = frames.frame(offset)
+                previous = offset
+            queue.put(frame)
+    except Exception as error:
+        errors.append(error)
+    finally:
+        queue.put(None)
 
 
-def create_video(out_file: str, image: ndarray, duration: float, fps: float = 60.0) -> None:
-    """Generates all video frames and writes them to the destination file."""
+def write_frames(out_file: str, image: ndarray, fps: float, direction: str,
+        step: Fraction, total_frames: int, start: int, stop: int) -> None:
+    """Writes the frames from start to stop of the video to a file,
+    generating them on another thread while the encoder runs."""
     #Creates a writer for the video.
     fourcc = cv.VideoWriter_fourcc(*'XVID')
     writer = cv.VideoWriter(out_file, fourcc, fps, image.shape[1::-1])
 
-    #Calculates the duration, in frames, of each image.
-    #Repeats the initial state at the beginning and the end
-    total_shifts = image.shape[1]
-    total_frames = round(fps * duration)
+    #Each frame is a window into the same doubled image.
+    axis, offsets = frame_offsets(
+        image.shape, total_frames, direction, step, start, stop)
+    frames = ShiftedFrames(image, axis)
+    queue = Queue(QUEUE_FRAMES)
+    errors = []
+    producer = threading.Thread(
+        target=produce_frames, args=(frames, offsets, queue, errors),
+        daemon=True)
+    producer.start()
 
-    #Writes the video frame by frame, shifting the image along
-    #the way based on the fraction of the video written.
-    shift_count = 0
-    for frame in range(total_frames):
-        while (frame + 1) / total_frames > shift_count / total_shifts:
-            shift_count += 1
-            image = shift_right(image)
-        writer.write(image)
+    while True:
+        frame = queue.get()
+        if frame is None:
+            break
+        writer.write(frame)
 
+    producer.join()
     writer.release()
+    if errors:
+        raise errors[0]
+
+
+def find_ffmpeg() -> str:
+    """Returns the path of the ffmpeg executable."""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg is needed to join video segments")
+    return ffmpeg
+
+
+def concatenate_videos(ffmpeg: str, paths: list, out_file: str) -> None:
+    """Joins video files into one without re-encoding them."""
+    list_file = os.path.join(os.path.dirname(paths[0]), 'segments.txt')
+    with open(list_file, 'w') as f:
+        for path in paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    subprocess.run(
+        [ffmpeg, '-loglevel', 'error', '-y', '-f', 'concat', '-safe', '0',
+            '-i', list_file, '-c', 'copy', out_file],
+        check=True)
+
+
+def create_video(out_file: str, image: ndarray, duration: float,
+        fps: float = 60.0, direction: str = 'right',
+        step: Fraction = Fraction(1), segments: int = 1) -> None:
+    """Generates all video frames and writes them to the destination file.
+    With more than one segment, consecutive parts of the video are encoded
+    in parallel processes and then joined."""
+    total_frames = round(fps * duration)
+    segments = max(min(segments, total_frames), 1)
+    if segments == 1:
+        write_frames(out_file, image, fps, direction, step, total_frames,
+            0, total_frames)
+        return
+
+    #Splits the frames into consecutive ranges of nearly equal length.
+    ffmpeg = find_ffmpeg()
+    bounds = [total_frames * i // segments for i in range(segments + 1)]
+    extension = os.path.splitext(out_file)[1]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = [os.path.join(tmp_dir, f'segment_{i}{extension}')
+            for i in range(segments)]
+        with ProcessPoolExecutor(segments) as pool:
+            futures = [pool.submit(write_frames, path, image, fps, direction,
+                    step, total_frames, start, stop)
+                for path, start, stop in zip(paths, bounds, bounds[1:])]
+            for future in futures:
+                future.result()
+        concatenate_videos(ffmpeg, paths, out_file)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,101 @@
+"""Lazy geometric transforms of images: flips, 90 degree rotations,
+transposes and circular shifts compose into one strided view and one
+shift, and the pixels are only copied when the result is materialized."""
+import numpy as np
+import pixels
+from PIL import Image
+
+
+class Transform:
+    """A chain of geometric operations applied to an H x W (x C) array.
+    
+    Any chain reduces to an optional transpose and flips of the source,
+    which NumPy expresses as a strided view, followed by a circular shift
+    of that view. Each operation only updates this state; materialize
+    copies the pixels once."""
+
+    def __init__(self, array: np.array):
+        self.array = array
+        self.transposed = False
+        self.flip_y = False
+        self.flip_x = False
+        self.shift_y = 0
+        self.shift_x = 0
+
+    @property
+    def shape(self) -> tuple:
+        """Shape of the transformed array."""
+        return self.view().shape
+
+    def view(self) -> np.array:
+        """Returns the transposed and flipped source, without the shift."""
+        view = self.array.swapaxes(0, 1) if self.transposed else self.array
+        return view[::-1 if self.flip_y else 1, ::-1 if self.flip_x else 1]
+
+    def flip_horizontal(self) -> 'Transform':
+        """Mirrors the result left to right."""
+        #Mirroring a shifted image equals shifting the mirror the other way.
+        self.flip_x = not self.flip_x
+        self.shift_x = -self.shift_x % self.shape[1]
+        return self
+
+    def flip_vertical(self) -> 'Transform':
+        """Mirrors the result top to bottom."""
+        self.flip_y = not self.flip_y
+        self.shift_y = -self.shift_y % self.shape[0]
+        return self
+
+    def transpose(self) -> 'Transform':
+        """Swaps the rows and columns of the result."""
+        self.transposed = not self.transposed
+        self.flip_y, self.flip_x = self.flip_x, self.flip_y
+        self.shift_y, self.shift_x = self.shift_x, self.shift_y
+        return self
+
+    def rotate(self, k: int = 1) -> 'Transform':
+        """Rotates the result k times by 90 degrees counterclockwise."""
+        k %= 4
+        if k == 2:
+            return self.flip_horizontal().flip_vertical()
+        if k == 1:
+            return self.transpose().flip_vertical()
+        if k == 3:
+            return self.transpose().flip_horizontal()
+        return self
+
+    def shift(self, dy: int, dx: int) -> 'Transform':
+        """Shifts the result circularly by dy rows down and dx columns
+        right."""
+        h, w = self.shape[:2]
+        self.shift_y = (self.shift_y + dy) % h
+        self.shift_x = (self.shift_x + dx) % w
+        return self
+
+    def materialize(self, out: np.array = None) -> np.array:
+        """Returns the transformed array, copying each pixel once. The result
+        is written to out when given."""
+        view = self.view()
+        h, w = view.shape[:2]
+        sy, sx = self.shift_y, self.shift_x
+        if out is None:
+            out = np.empty_like(view, order='C')
+
+        #The shift splits the result into up to four blocks of the view.
+        for dst_y, src_y in ((slice(sy, h), slice(0, h - sy)),
+                             (slice(0, sy), slice(h - sy, h))):
+            for dst_x, src_x in ((slice(sx, w), slice(0, w - sx)),
+                                 (slice(0, sx), slice(w - sx, w))):
+                out[dst_y, dst_x] = view[src_y, src_x]
+        return out
+
+
+def from_image(image: Image) -> Transform:
+    """Returns an empty transform of the pixels of a Pillow image."""
+    return Transform(pixels.as_array(image))
+
+
+def to_image(transform: Transform, image: Image) -> Image:
+    """Returns a new image with the mode and palette of the given one
+    holding the transformed pixels."""
+    return pixels.to_image(transform.materialize(), image.mode,
+                           image.getpalette())
@@ -0,0 +1,190 @@
+"""Moves pixels between Pillow images and NumPy arrays without creating a
+Python object per pixel."""
+import glob
+import numpy as np
+import os
+import warnings
+from PIL import Image
+
+#Array dtype and number of channels of each supported mode.
+MODES = {
+    'L': (np.uint8, 1),
+    'P': (np.uint8, 1),
+    'LA': (np.uint8, 2),
+    'RGB': (np.uint8, 3),
+    'YCbCr': (np.uint8, 3),
+    'RGBA': (np.uint8, 4),
+    'CMYK': (np.uint8, 4),
+    'I;16': (np.dtype('<u2'), 1),
+    'I': (np.int32, 1),
+    'F': (np.float32, 1),
+}
+
+#Modes whose pixels Pillow can read straight from an array's memory.
+SHARED_MODES = ('L', 'P', 'RGBA', 'CMYK', 'I;16')
+
+
+def array_shape(mode: str, size: (int, int)) -> tuple:
+    """Returns the shape of the array holding an image's pixels."""
+    if mode not in MODES:
+        raise ValueError(f"Unsupported mode: {mode}")
+    w, h = size
+    channels = MODES[mode][1]
+    return (h, w) if channels == 1 else (h, w, channels)
+
+
+def as_array(image: Image) -> np.array:
+    """Returns the pixels of an image as a read-only H x W (x C) array, copied
+    once by Pillow's C code through the array interface. P images give
+    their palette indices."""
+    array_shape(image.mode, image.size)
+    return np.asarray(image)
+
+
+def to_image(array: np.array, mode: str, palette: list = None) -> Image:
+    """Returns an image of the given mode holding the pixels of an
+    H x W (x C) array.
+    
+    For SHARED_MODES the image uses the array's memory, so later writes to
+    the array show in the image and nothing is copied unless the array had
+    to be made contiguous. Other modes are copied once."""
+    dtype = MODES.get(mode, (None,))[0]
+    array = np.ascontiguousarray(array, dtype=dtype)
+    size = (array.shape[1], array.shape[0])
+    if array.shape != array_shape(mode, size):
+        raise ValueError(f"Invalid array shape for mode {mode}")
+    
+    image = Image.frombuffer(mode, size, array, 'raw', mode, 0, 1)
+    if palette is not None:
+        image.putpalette(palette)
+    return image
+
+
+def write_back(array: np.array, image: Image) -> None:
+    """Overwrites the pixels of an image with those of an array of the same
+    shape, decoding straight from the array's memory."""
+    dtype = MODES.get(image.mode, (None,))[0]
+    if array.shape != array_shape(image.mode, image.size):
+        raise ValueError(f"Invalid array shape for mode {image.mode}")
+    image.frombytes(np.ascontiguousarray(array, dtype=dtype))
+
+
+#Array dtype, number of channels and position of each image channel of the
+#raw (uncompressed) pixel layouts that can be mapped from a file.
+RAW_MODES = {
+    'L': (np.uint8, 1, (0,)),
+    'P': (np.uint8, 1, (0,)),
+    'RGB': (np.uint8, 3, (0, 1, 2)),
+    'BGR': (np.uint8, 3, (2, 1, 0)),
+    'RGBA': (np.uint8, 4, (0, 1, 2, 3)),
+    'BGRA': (np.uint8, 4, (2, 1, 0, 3)),
+    'RGBX': (np.uint8, 4, (0, 1, 2)),
+    'BGRX': (np.uint8, 4, (2, 1, 0)),
+    'I;16': (np.dtype('<u2'), 1, (0,)),
+    'I;16B': (np.dtype('>u2'), 1, (0,)),
+}
+
+
+def tile_layout(tile, width: int) -> (int, str, int, int):
+    """Returns the offset, raw mode, row stride and row direction of a
+    Pillow tile of uncompressed pixels, or None for other tiles."""
+    codec, extents, offset, args = tile[:4]
+    if codec != 'raw':
+        return None
+    
+    if isinstance(args, str):
+        args = (args,)
+    rawmode, stride, direction = (tuple(args) + (0, 1))[:3]
+    if rawmode not in RAW_MODES:
+        return None
+    dtype, channels, _ = RAW_MODES[rawmode]
+    if not stride:
+        stride = width * channels * np.dtype(dtype).itemsize
+    return offset, rawmode, stride, direction
+
+
+def raw_strips(image: Image) -> list:
+    """Returns (upper, lower, layout) for each horizontal strip of an
+    opened, not yet loaded image whose file stores its pixels as full-width
+    strips of uncompressed pixels, top to bottom, or None if it doesn't."""
+    w, h = image.size
+    strips = []
+    for tile in image.tile:
+        left, upper, right, lower = tile[1]
+        layout = tile_layout(tile, w)
+        expected = strips[-1][1] if strips else 0
+        if layout is None or (left, right, upper) != (0, w, expected):
+            return None
+        strips.append((upper, lower, layout))
+    if not strips or strips[-1][1] != h:
+        return None
+    return strips
+
+
+def raw_layout(image: Image) -> (int, str, int, int):
+    """Returns the offset, raw mode, row stride and row direction of the
+    pixels of an opened, not yet loaded image whose file stores them as one
+    uncompressed tile, or None if it doesn't."""
+    strips = raw_strips(image)
+    if strips is None or len(strips) != 1:
+        return None
+    return strips[0][2]
+
+
+#Bytes per entry of the raw palette layouts header_palette can decode.
+PALETTE_RAW_MODES = {'RGB': 3, 'RGB;L': 3, 'BGR': 3, 'RGBX': 4, 'BGRX': 4}
+
+
+def header_palette(image: Image) -> list:
+    """Returns the palette of an opened, not yet loaded image as a flat list
+    of RGB values, read from the file header without decoding the pixels,
+    or None if the image has no palette in a known layout."""
+    palette = image.palette
+    if palette is None or palette.mode != 'RGB':
+        return None
+    rawmode = palette.rawmode or 'RGB'
+    if rawmode not in PALETTE_RAW_MODES:
+        return None
+    
+    data = bytes(palette.palette)
+    entries = len(data) // PALETTE_RAW_MODES[rawmode]
+    if entries == 0:
+        return None
+    entries_image = Image.frombytes(
+        'RGB', (entries, 1), data, 'raw', rawmode)
+    return list(entries_image.tobytes())
+
+
+def raw_array(path: str, size: (int, int), layout: tuple,
+        access: str = 'r') -> np.array:
+    """Maps the pixels of an image file with the given raw_layout as an
+    H x W (x C) array, top row first, with channels in file order."""
+    offset, rawmode, stride, direction = layout
+    dtype, channels, _ = RAW_MODES[rawmode]
+    w, h = size
+    rows = np.memmap(path, np.uint8, access, offset, (h, stride))
+    if direction < 0:
+        rows = rows[::-1]
+    
+    array = rows[:, :w * channels * np.dtype(dtype).itemsize].view(dtype)
+    return array if channels == 1 else array.reshape(h, w, channels)
+
+
+def find_images(pattern: str) -> list:
+    """Returns the sorted paths of the files in a directory or matched by
+    a glob pattern that Pillow can open. Other files are skipped with a
+    warning."""
+    if os.path.isdir(pattern):
+        paths = (os.path.join(pattern, name) for name in os.listdir(pattern))
+    else:
+        paths = glob.glob(pattern)
+    
+    #Opening only reads the header; the pixels aren't decoded.
+    images = []
+    for path in sorted(path for path in paths if os.path.isfile(path)):
+        try:
+            with Image.open(path):
+                images.append(path)
+        except OSError:
+            warnings.warn(f"Skipping file that isn't an image: {path}")
+    return images
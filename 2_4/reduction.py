@@ -0,0 +1,142 @@
+"""Sums and finds the extremes of the pixels of images too large for memory,
+reading them strip by strip from memory maps and reducing the strips on a
+thread pool."""
+import numpy as np
+import os
+import pixels
+import struct
+from PIL import Image
+from scheduler import run_bands
+
+#Approximate size, in bytes, of the rows reduced by each task.
+BAND_BYTES = 2**22
+
+#Weights of Pillow's RGB to L conversion, in 16-bit fixed point.
+LUMA_WEIGHTS = (19595, 38470, 7471)
+
+#Single-channel modes converted to L strip by strip when mapped.
+GRAY_MODES = ('L', 'I;16', 'I;16B', 'I', 'F')
+
+
+def open_header(fp) -> Image:
+    """Returns an image read from an open file by the first Pillow plugin
+    that accepts it, without loading its pixels.
+    
+    Unlike Image.open, this skips the size check against decompression
+    bombs, so it's only meant for reading the layout of files whose pixels
+    are then memory mapped rather than decoded."""
+    prefix = fp.read(16)
+    Image.preinit()
+    for initialized in (False, True):
+        if initialized:
+            Image.init()
+        for format_id in Image.ID:
+            factory, accept = Image.OPEN[format_id]
+            result = not accept or accept(prefix)
+            if not result or isinstance(result, str):
+                continue
+            try:
+                fp.seek(0)
+                return factory(fp, fp.name)
+            except (SyntaxError, IndexError, TypeError, struct.error):
+                continue
+    raise ValueError("Invalid image")
+
+
+def open_strips(path: str) -> (list, tuple):
+    """Returns the pixels of an image file as horizontal strips, top to
+    bottom, and the positions of the R, G and B samples of a pixel, or None
+    for grayscale strips.
+    
+    NPY files and files storing their pixels as uncompressed strips (BMP,
+    PPM/PGM, plain TIFF) are memory mapped. Compressed files can't be read
+    in parts, so they are decoded whole."""
+    if os.path.splitext(path)[1].lower() == '.npy':
+        array = np.load(path, mmap_mode='r')
+        if array.ndim == 3 and array.dtype != np.uint8:
+            raise ValueError("Invalid image")
+        return [array], ((0, 1, 2) if array.ndim == 3 else None)
+    
+    #Only the strips are mapped, so the size limit against decompression
+    #bombs doesn't apply to them.
+    with open(path, 'rb') as fp:
+        image = open_header(fp)
+        strips = pixels.raw_strips(image)
+        mode = image.mode
+        w = image.size[0]
+    
+    if strips is None or mode not in GRAY_MODES + ('RGB', 'RGBA'):
+        #Decodes the file whole, with Pillow's size limit in force.
+        with Image.open(path) as image:
+            if image.mode != 'L':
+                image = image.convert('L')
+            return [pixels.as_array(image)], None
+    
+    arrays = [pixels.raw_array(path, (w, lower - upper), layout)
+        for upper, lower, layout in strips]
+    order = pixels.RAW_MODES[strips[0][2][1]][2]
+    return arrays, (order[:3] if len(order) >= 3 else None)
+
+
+def split_bands(strips: list) -> list:
+    """Returns the strips cut into bands of about BAND_BYTES."""
+    bands = []
+    for strip in strips:
+        row_bytes = max(strip[:1].nbytes, 1)
+        rows = max(BAND_BYTES // row_bytes, 1)
+        bands.extend(strip[y:y + rows] for y in range(0, len(strip), rows))
+    return bands
+
+
+def luminance(band: np.array, rgb: tuple) -> np.array:
+    """Returns the 8-bit gray levels of a band of pixels the way Pillow
+    converts it to L: RGB through the fixed-point luma weights, other
+    samples clipped to 0-255 and truncated."""
+    if rgb is None:
+        if band.dtype == np.uint8:
+            return band
+        return np.clip(band, 0, 255).astype(np.uint8)
+    gray = np.full(band.shape[:2], 0x8000, dtype=np.uint32)
+    term = np.empty_like(gray)
+    for channel, weight in zip(rgb, LUMA_WEIGHTS):
+        np.multiply(band[..., channel], weight, out=term, dtype=np.uint32)
+        gray += term
+    gray >>= 16
+    return gray.astype(np.uint8)
+
+
+def reduce(path: str, workers: int = 1) -> (int, int, int):
+    """Returns the sum, minimum and maximum of the pixels of an image file
+    converted to 8-bit grayscale (L) as Pillow's convert does, reading at
+    most a few bands per worker into memory at a time. The results match
+    those of e2_5 and e2_6 without --stream."""
+    strips, rgb = open_strips(path)
+    bands = split_bands(strips)
+    if not bands:
+        raise ValueError("Invalid image")
+    partials = [None] * len(bands)
+
+    def reduce_bands(start, stop):
+        for i in range(start, stop):
+            gray = luminance(bands[i], rgb)
+            partials[i] = (gray.sum(dtype=np.uint64),
+                gray.min(), gray.max())
+
+    run_bands(reduce_bands, len(bands), workers, band=1)
+    
+    #Merges the partial results, summing them as Python numbers.
+    total = sum(partial[0].item() for partial in partials)
+    minimum = min(partial[1] for partial in partials).item()
+    maximum = max(partial[2] for partial in partials).item()
+    return total, minimum, maximum
+
+
+def count_values(path: str, workers: int = 1) -> int:
+    """Returns the sum of the 8-bit gray levels of an image file."""
+    return reduce(path, workers)[0]
+
+
+def find_min_max(path: str, workers: int = 1) -> (int, int):
+    """Returns the minimum and maximum 8-bit gray levels of an image
+    file."""
+    return reduce(path, workers)[1:]
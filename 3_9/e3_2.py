@@ -2,10 +2,12 @@
 """Generates the cumulative histogram of an image."""
 import argparse
 import cv2 as cv
-import matplotlib.pyplot as plt
 import numpy as np
-from matplotlib.axes import Axes
-from matplotlib.figure import Figure
+from scheduler import run_bands
+
+#Number of pixels counted by each call to bincount, which converts its input
+#to 64-bit integers.
+TILE_PIXELS = 2**20
 
 def main():
     parser = argparse.ArgumentParser(
@@ -16,6 +18,12 @@ def main():
         action='store_true',
         help='if used, creates a regular histogram '
             'instead of a cumulative histogram')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='number of threads counting tiles of the image '
+            '(default: %(default)d)')
     parser.add_argument(
         'in_image',
         metavar='in',
@@ -31,27 +39,72 @@ def main():
     
     image = cv.imread(args.in_image, cv.IMREAD_GRAYSCALE)
     if args.create_regular_histogram:
-        c_hist, bin_edges = histogram_8bit_grayscale(image)
+        c_hist, bin_edges = histogram_8bit_grayscale(image, args.workers)
     else:
-        c_hist, bin_edges = cumulative_histogram_8bit_grayscale(image)
-    fig, _ = custom_histogram_plot(c_hist, bin_edges)
+        c_hist, bin_edges = cumulative_histogram_8bit_grayscale(
+            image, args.workers)
     if args.out_image is None:
+        import matplotlib.pyplot as plt
+        custom_histogram_plot(c_hist, bin_edges)
         plt.show()
     else:
-        fig.savefig(args.out_image)
+        save_histogram(args.out_image, c_hist, bin_edges)
+
+
+def histogram(image: np.array, workers: int = 1) -> np.array:
+    """Returns the number of pixels with each level of a uint8 or uint16
+    image: a (levels,) array for single-channel images and a
+    (channels, levels) array for multi-channel ones.
+    
+    All channels are counted in one bincount per tile by offsetting each
+    channel's levels into its own range of bins. Tiles are counted on
+    workers threads and their partial histograms merged."""
+    if image.dtype not in (np.uint8, np.uint16):
+        raise ValueError("Invalid image")
+    levels = 2 ** (8 * image.itemsize)
+    channels = image.shape[2] if image.ndim == 3 else 1
+    pixels = image.reshape(-1, channels)
+    offsets = np.arange(channels, dtype=np.intp) * levels
+    
+    #Each band of tiles is counted into its own partial histogram.
+    tiles = -(-len(pixels) // TILE_PIXELS)
+    band = max(-(-tiles // max(workers, 1)), 1)
+    partials = np.zeros((-(-tiles // band), channels * levels), np.int64)
+
+    def count_tiles(start, stop):
+        partial = partials[start // band]
+        for tile in range(start, stop):
+            values = pixels[tile * TILE_PIXELS:(tile + 1) * TILE_PIXELS]
+            if channels > 1:
+                values = values + offsets
+            partial += np.bincount(values.reshape(-1),
+                minlength=channels * levels)
+
+    run_bands(count_tiles, tiles, workers, band)
+    hist = merge_histograms(partials)
+    return hist if channels == 1 else hist.reshape(channels, levels)
 
 
-def histogram_8bit_grayscale(image: np.array) -> (np.array, np.array):
+def merge_histograms(partials) -> np.array:
+    """Returns the histogram of the union of the pixels counted by partial
+    histograms with the same shape, e.g. computed for separate tiles."""
+    return np.sum(partials, axis=0, dtype=np.int64)
+
+
+def histogram_8bit_grayscale(image: np.array, workers: int = 1) -> (np.array, np.array):
     """Returns the histogram and list of bin edges for an array,
     optimized for 8-bit grayscale images."""
-    return np.histogram(image, bins=256, range=(0,256))
+    bin_edges = np.linspace(0, 256, 257)
+    if image.dtype != np.uint8:
+        return np.histogram(image, bins=256, range=(0,256))
+    return histogram(image.reshape(-1), workers), bin_edges
 
 
-def cumulative_histogram_8bit_grayscale(image: np.array) -> (np.array, np.array):
+def cumulative_histogram_8bit_grayscale(image: np.array, workers: int = 1) -> (np.array, np.array):
     """Returns the cumulative histogram and list of bin edges for an array,
     optimized for 8-bit grayscale images."""
     #Regular histogram.
-    hist, bin_edges = histogram_8bit_grayscale(image)
+    hist, bin_edges = histogram_8bit_grayscale(image, workers)
     
     #Cumulative histogram based on regular histogram.
     c_hist = hist.cumsum()
@@ -59,9 +112,13 @@ def cumulative_histogram_8bit_grayscale(image: np.array) -> (np.array, np.array)
     return c_hist, bin_edges
 
 
-def custom_histogram_plot(data: np.array, bin_edges: np.array) -> (Figure, Axes):
+def custom_histogram_plot(data: np.array, bin_edges: np.array) -> ('Figure', 'Axes'):
     """Returns a custom bar plot optimized for histograms of cumulative
     histograms."""
+    #Imported here, so computing or rasterizing histograms doesn't pay for
+    #loading matplotlib.
+    import matplotlib.pyplot as plt
+    
     #Preprocesses the data
     data_x = bin_edges[:-1]
     data_y = data
@@ -102,5 +159,84 @@ def custom_histogram_plot(data: np.array, bin_edges: np.array) -> (Figure, Axes)
     return fig, ax
 
 
+def render_histogram(data: np.array, bin_edges: np.array,
+        width: int = 640) -> np.array:
+    """Returns an 8-bit grayscale image of the plot made by
+    custom_histogram_plot, drawn directly into an array."""
+    #Preprocesses the data
+    data_x = bin_edges[:-1]
+    data_y = data
+    
+    #Formatting constants.
+    BLACK = 0
+    GRAY = 0x3f
+    WHITE = 255
+    SCALE = 1.05
+    LIM_X = data_x.max() * SCALE
+    LIM_Y = max(data_y.max(), 1) * SCALE
+    FONT = cv.FONT_HERSHEY_COMPLEX
+    FONT_SCALE = width / 1280
+    ASPECT = 5/12
+    ARROW_LENGTH = width // 64
+    TICK_LENGTH = width // 160
+    
+    #Creates the canvas and places the plot area in it.
+    left = right = width // 10
+    top = bottom = width // 12
+    plot_w = width - left - right
+    plot_h = round(plot_w * ASPECT)
+    image = np.full((top + plot_h + bottom, width), WHITE, dtype=np.uint8)
+    origin = (left, top + plot_h)
+    
+    #Bars: each column of the plot area shows the bar under its center.
+    x = (np.arange(plot_w) + 0.5) * LIM_X / plot_w
+    bins = np.searchsorted(data_x, x, side='right') - 1
+    inside = (bins >= 0) & (x < data_x[bins.clip(0)] + 1)
+    heights = np.where(inside, data_y[bins.clip(0)], 0) * plot_h / LIM_Y
+    rows = np.arange(plot_h)[:, None]
+    bars = rows >= plot_h - np.round(heights)
+    image[top:top + plot_h, left:left + plot_w][bars] = GRAY
+    
+    #Ticks and their labels.
+    for tick in (bin_edges[0], bin_edges[-2]):
+        tick_x = left + round(tick * plot_w / LIM_X)
+        image[origin[1]:origin[1] + TICK_LENGTH, tick_x] = BLACK
+        label = f'{tick:g}'
+        (text_w, text_h), _ = cv.getTextSize(label, FONT, FONT_SCALE, 1)
+        cv.putText(image, label,
+            (tick_x - text_w // 2, origin[1] + 2 * TICK_LENGTH + text_h),
+            FONT, FONT_SCALE, BLACK, 1, cv.LINE_AA)
+    
+    #Labels.
+    (text_w, text_h), _ = cv.getTextSize('i', FONT, FONT_SCALE, 1)
+    cv.putText(image, 'i',
+        (left + plot_w - text_w, origin[1] + 4 * TICK_LENGTH + 2 * text_h),
+        FONT, FONT_SCALE, BLACK, 1, cv.LINE_AA)
+    (text_w, text_h), _ = cv.getTextSize('H(i)', FONT, FONT_SCALE, 1)
+    cv.putText(image, 'H(i)', (left - text_w - 2 * TICK_LENGTH, top + text_h),
+        FONT, FONT_SCALE, BLACK, 1, cv.LINE_AA)
+    
+    #Arrows.
+    for end in ((left, top), (left + plot_w, origin[1])):
+        length = max(abs(end[0] - origin[0]), abs(end[1] - origin[1]))
+        cv.arrowedLine(image, origin, end, BLACK, 1, cv.LINE_AA,
+            tipLength=ARROW_LENGTH / length)
+    
+    return image
+
+
+def save_histogram(path: str, data: np.array, bin_edges: np.array) -> None:
+    """Saves a histogram plot to a file. Raster formats OpenCV can write are
+    drawn by render_histogram; others, like PDF or SVG, use matplotlib."""
+    if cv.haveImageWriter(path):
+        if not cv.imwrite(path, render_histogram(data, bin_edges)):
+            raise ValueError(f"Could not write image: {path}")
+    else:
+        import matplotlib.pyplot as plt
+        fig, _ = custom_histogram_plot(data, bin_edges)
+        fig.savefig(path)
+        plt.close(fig)
+
+
 if __name__ == '__main__':
     main()
@@ -3,7 +3,6 @@
 import argparse
 import cv2 as cv
 import e3_2 as histogram
-import matplotlib.pyplot as plt
 import numpy as np
 
 def main():
@@ -35,10 +34,11 @@ def main():
     if args.out_image is not None:
         cv.imwrite(args.out_image, image)
     hist, bin_edges = histogram.histogram_8bit_grayscale(image)
-    fig, _ = histogram.custom_histogram_plot(hist, bin_edges)
     if args.out_hist is not None:
-        fig.savefig(args.out_hist)
+        histogram.save_histogram(args.out_hist, hist, bin_edges)
     else:
+        import matplotlib.pyplot as plt
+        histogram.custom_histogram_plot(hist, bin_edges)
         plt.show()
 
 
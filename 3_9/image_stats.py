@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Calculates the sum, minimum, maximum, mean, variance and histogram of a
+grayscale image in a single pass over its pixels, and prints them as JSON."""
+import argparse
+import cv2 as cv
+import e3_2 as histogram
+import json
+import numpy as np
+
+#Statistics that can be requested, in output order.
+STATISTICS = ('sum', 'min', 'max', 'mean', 'variance', 'histogram')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__)
+    parser.add_argument(
+        '-s', '--stats',
+        type=parse_stats,
+        default=STATISTICS,
+        metavar='STATS',
+        help='comma-separated statistics to calculate '
+            f'({", ".join(STATISTICS)}; default: all)')
+    parser.add_argument(
+        '-o', '--out',
+        dest='out_json',
+        default=None,
+        help='where the JSON will be saved; if missing, prints it')
+    parser.add_argument(
+        'in_image',
+        metavar='in',
+        help='the image to be processed; 16-bit images keep their depth')
+    args = parser.parse_args()
+    
+    image = cv.imread(args.in_image, cv.IMREAD_GRAYSCALE | cv.IMREAD_ANYDEPTH)
+    if image is None:
+        raise ValueError("Invalid image")
+    stats = image_stats(image, args.stats)
+    if args.out_json is None:
+        print(json.dumps(stats))
+    else:
+        with open(args.out_json, 'w') as f:
+            json.dump(stats, f)
+
+
+def parse_stats(text: str) -> tuple:
+    """Parses a comma-separated list of statistics."""
+    stats = tuple(stat.strip() for stat in text.split(','))
+    for stat in stats:
+        if stat not in STATISTICS:
+            raise argparse.ArgumentTypeError(f"invalid statistic: {stat}")
+    return stats
+
+
+def count_levels(image: np.array) -> np.array:
+    """Returns the number of pixels with each level of an 8 or 16-bit
+    grayscale image, reading the pixels once."""
+    return histogram.histogram(image.reshape(-1))
+
+
+def image_stats(image: np.array, stats=STATISTICS) -> dict:
+    """Returns the requested statistics of an 8 or 16-bit grayscale image,
+    all derived from one histogram of its levels."""
+    hist = count_levels(image)
+    return histogram_stats(hist, stats)
+
+
+def histogram_stats(hist: np.array, stats=STATISTICS) -> dict:
+    """Returns the requested statistics of the pixels counted by a
+    histogram of levels."""
+    present = np.flatnonzero(hist)
+    if present.size == 0:
+        raise ValueError("Invalid image")
+    levels = np.arange(hist.size)
+    count = int(hist.sum())
+    total = int((hist.astype(np.uint64) * levels.astype(np.uint64)).sum())
+    mean = total / count
+    
+    result = {}
+    for stat in STATISTICS:
+        if stat not in stats:
+            continue
+        if stat == 'sum':
+            result[stat] = total
+        elif stat == 'min':
+            result[stat] = int(present[0])
+        elif stat == 'max':
+            result[stat] = int(present[-1])
+        elif stat == 'mean':
+            result[stat] = mean
+        elif stat == 'variance':
+            #Centered on the mean to avoid losing precision.
+            result[stat] = float((hist * (levels - mean) ** 2).sum() / count)
+        elif stat == 'histogram':
+            result[stat] = hist.tolist()
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""Runs independent bands of array work on shared thread pools.
+
+The chapters' scripts are run from their own directories, so each one that
+uses this module keeps an identical copy of it (2_4, 3_9, 19_6 and 20_5);
+change them together."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BAND_SIZE = 256
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(workers: int) -> ThreadPoolExecutor:
+    """Returns the shared thread pool with the given number of workers,
+    creating it on first use.
+    
+    Pools are kept until the process ends rather than replaced, so callers
+    running at the same time with different numbers of workers never shut
+    down each other's pool."""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ThreadPoolExecutor(workers)
+            _pools[workers] = pool
+        return pool
+
+
+def run_bands(func, n: int, workers: int = 1, band: int = BAND_SIZE) -> None:
+    """Calls func(start, stop) for consecutive bands covering range(n).
+    
+    func is expected to write its results straight into a preallocated
+    output. NumPy releases the GIL inside its heavy kernels, so with more
+    than one worker the bands run in parallel on the shared pool. Bands
+    always have the same size, so results don't depend on workers."""
+    bounds = [(start, min(start + band, n)) for start in range(0, n, band)]
+    if workers <= 1 or len(bounds) <= 1:
+        for start, stop in bounds:
+            func(start, stop)
+        return
+    
+    pool = get_pool(workers)
+    for future in [pool.submit(func, *bound) for bound in bounds]:
+        future.result()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Calculates statistics of every frame of a video, reading it as a stream,
+and saves them as one row per frame to a CSV or NPY file."""
+import argparse
+import csv
+import cv2 as cv
+import image_stats
+import numpy as np
+import os
+import tempfile
+
+#Number of rows copied at a time when assembling an NPY file.
+CHUNK_ROWS = 4096
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__)
+    parser.add_argument(
+        '-s', '--stats',
+        type=image_stats.parse_stats,
+        default=image_stats.STATISTICS,
+        metavar='STATS',
+        help='comma-separated statistics to calculate '
+            f'({", ".join(image_stats.STATISTICS)}; default: all)')
+    parser.add_argument(
+        '--start',
+        type=int,
+        default=0,
+        help='number of frames skipped at the beginning (default: %(default)d)')
+    parser.add_argument(
+        '--stride',
+        type=int,
+        default=1,
+        help='analyzes one of every STRIDE frames (default: %(default)d)')
+    parser.add_argument(
+        '--frames',
+        type=int,
+        default=None,
+        help='maximum number of frames analyzed (default: all)')
+    parser.add_argument(
+        'in_video',
+        metavar='in',
+        help='the video to be processed')
+    parser.add_argument(
+        'out_path',
+        metavar='out',
+        help='where the statistics will be saved; as NPY if it ends in '
+            '.npy, otherwise as CSV')
+    args = parser.parse_args()
+    
+    if args.start < 0 or args.stride < 1:
+        parser.error("--start must be at least 0 and --stride at least 1")
+    rows = frame_stats(args.in_video, args.stats, args.start, args.stride,
+        args.frames)
+    if os.path.splitext(args.out_path)[1].lower() == '.npy':
+        write_npy(rows, args.stats, args.out_path)
+    else:
+        write_csv(rows, args.stats, args.out_path)
+
+
+def read_frames(path: str, start: int = 0, stride: int = 1,
+        limit: int = None):
+    """Yields the index and grayscale version of the frames of a video from
+    start, one of every stride frames. Skipped frames aren't decoded, and
+    the yielded arrays are reused between frames."""
+    capture = cv.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Invalid video")
+    
+    frame = None
+    gray = None
+    index = start
+    count = 0
+    try:
+        for _ in range(start):
+            if not capture.grab():
+                return
+        while limit is None or count < limit:
+            ok, frame = capture.read(frame)
+            if not ok:
+                return
+            gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY, gray)
+            yield index, gray
+            count += 1
+            
+            for _ in range(stride - 1):
+                if not capture.grab():
+                    return
+            index += stride
+    finally:
+        capture.release()
+
+
+def frame_stats(path: str, stats=image_stats.STATISTICS, start: int = 0,
+        stride: int = 1, limit: int = None):
+    """Yields the index and statistics of the frames of a video."""
+    for index, gray in read_frames(path, start, stride, limit):
+        hist = image_stats.count_levels(gray)
+        yield index, image_stats.histogram_stats(hist, stats)
+
+
+def columns(stats) -> list:
+    """Returns the names of the columns of a row, in order."""
+    names = ['frame']
+    for stat in image_stats.STATISTICS:
+        if stat == 'histogram' and stat in stats:
+            names.extend(f'histogram_{i}' for i in range(256))
+        elif stat in stats:
+            names.append(stat)
+    return names
+
+
+def record_dtype(stats) -> np.dtype:
+    """Returns the NPY record type of a row. The histogram is one field
+    holding 256 counts."""
+    types = {
+        'sum': (np.uint64,),
+        'min': (np.uint8,),
+        'max': (np.uint8,),
+        'mean': (np.float64,),
+        'variance': (np.float64,),
+        'histogram': (np.int64, (256,)),
+    }
+    fields = [('frame', np.int64)]
+    fields.extend((stat,) + types[stat]
+        for stat in image_stats.STATISTICS if stat in stats)
+    return np.dtype(fields)
+
+
+def write_csv(rows, stats, out_path: str) -> None:
+    """Writes rows of frame statistics to a CSV file as they arrive."""
+    with open(out_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns(stats))
+        for index, result in rows:
+            row = [index]
+            for stat in image_stats.STATISTICS:
+                if stat == 'histogram' and stat in result:
+                    row.extend(result[stat])
+                elif stat in result:
+                    row.append(result[stat])
+            writer.writerow(row)
+
+
+def write_npy(rows, stats, out_path: str) -> None:
+    """Writes rows of frame statistics to an NPY file of records.
+    
+    The number of rows isn't known until the video ends, so the records
+    are first appended to a temporary file and then copied in chunks after
+    the NPY header."""
+    dtype = record_dtype(stats)
+    record = np.zeros(1, dtype=dtype)
+    count = 0
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    with tempfile.TemporaryFile(dir=out_dir) as raw:
+        for index, result in rows:
+            record['frame'] = index
+            for stat, value in result.items():
+                record[stat] = value
+            raw.write(record.tobytes())
+            count += 1
+        
+        out = np.lib.format.open_memmap(out_path, 'w+', dtype, (count,))
+        raw.seek(0)
+        for start in range(0, count, CHUNK_ROWS):
+            chunk = np.fromfile(raw, dtype, min(CHUNK_ROWS, count - start))
+            out[start:start + len(chunk)] = chunk
+        out.flush()
+        del out
+
+
+if __name__ == '__main__':
+    main()